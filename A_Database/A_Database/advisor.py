@@ -0,0 +1,109 @@
+import time
+from threading import Lock
+from typing import Dict, List, Set
+from mydb_types import ExplainPlan
+
+class FieldUsage:
+    def __init__(self):
+        self.queries = 0
+        self.range_queries = 0
+        self.scanned = 0
+        self.saving = 0.0
+        self.selectivity = 0.0
+        self.last_used = time.time()
+
+class IndexAdvisor:
+    """Turns observed filters into index create/drop advice for one collection.
+
+    Every executed query reports the fields it filtered on, the plan and how
+    many rows it returned. For fields no index served, the rows the scan read
+    beyond those it returned count as the saving an index would have given.
+    An index is advised once that saving outweighs ``benefit_ratio`` times
+    the cost of building it, and indexes the advisor created itself are
+    dropped again after ``idle_seconds`` without serving a query.
+    """
+
+    def __init__(self, min_queries: int = 20, benefit_ratio: float = 1.0, max_selectivity: float = 0.3,
+                 build_cost_per_row: float = 2.0, idle_seconds: float = 3600.0):
+        self.min_queries = min_queries
+        self.benefit_ratio = benefit_ratio
+        self.max_selectivity = max_selectivity
+        self.build_cost_per_row = build_cost_per_row
+        self.idle_seconds = idle_seconds
+        self.fields: Dict[str, FieldUsage] = {}
+        self.created: Set[str] = set()
+        self.lock = Lock()
+
+    def record(self, conditions: Dict, plan: ExplainPlan, rows: int):
+        served = self.served_fields(plan)
+        candidates = plan.get("candidates", rows)
+        returned = plan.get("actual_rows", plan.get("estimated_rows", candidates))
+        selectivity = returned / rows if rows else 0.0
+        now = time.time()
+        with self.lock:
+            for field, condition in conditions.items():
+                usage = self.fields.get(field)
+                if usage is None:
+                    usage = self.fields[field] = FieldUsage()
+                usage.queries += 1
+                usage.selectivity += selectivity
+                if isinstance(condition, dict) and any(op in condition for op in ("$gt", "$gte", "$lt", "$lte")):
+                    usage.range_queries += 1
+                if field in served:
+                    usage.last_used = now
+                else:
+                    usage.scanned += candidates
+                    usage.saving += max(candidates - returned, 0)
+
+    @staticmethod
+    def served_fields(plan: ExplainPlan) -> Set[str]:
+        if plan.get("method", "full_scan") == "full_scan":
+            return set()
+        fields = set((plan.get("field") or "").split(","))
+        for child in plan.get("children", []):
+            fields |= IndexAdvisor.served_fields(child)
+        return fields
+
+    def advise(self, rows: int, indexed: Set[str]) -> List[Dict]:
+        advice = []
+        now = time.time()
+        build_cost = rows * self.build_cost_per_row
+        with self.lock:
+            for field, usage in self.fields.items():
+                selectivity = usage.selectivity / usage.queries if usage.queries else 1.0
+                if field in indexed:
+                    if field in self.created and now - usage.last_used > self.idle_seconds:
+                        advice.append({"action": "drop", "field": field, "kind": None,
+                                       "reason": f"unused for {int(now - usage.last_used)}s"})
+                    continue
+                if usage.queries < self.min_queries or selectivity > self.max_selectivity:
+                    continue
+                if usage.saving >= build_cost * self.benefit_ratio:
+                    kind = "ordered" if usage.range_queries * 2 > usage.queries else "hash"
+                    advice.append({"action": "create", "field": field, "kind": kind,
+                                   "reason": f"{usage.queries} queries scanned {usage.scanned} rows, "
+                                             f"saving {usage.saving:.0f} vs build cost {build_cost:.0f}"})
+        return advice
+
+    def applied(self, item: Dict):
+        with self.lock:
+            field = item["field"]
+            if item["action"] == "create":
+                self.created.add(field)
+                self.fields[field] = FieldUsage()
+            else:
+                self.created.discard(field)
+                self.fields.pop(field, None)
+
+    def summary(self) -> Dict:
+        with self.lock:
+            return {
+                field: {
+                    "queries": usage.queries,
+                    "scanned_rows": usage.scanned,
+                    "estimated_saving": round(usage.saving),
+                    "avg_selectivity": round(usage.selectivity / usage.queries, 4) if usage.queries else None,
+                    "auto_created": field in self.created
+                }
+                for field, usage in self.fields.items()
+            }
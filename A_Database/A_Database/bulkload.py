@@ -0,0 +1,135 @@
+import json
+import re
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List, Union
+from mydb_types import Data, Records
+from index import IndexManager
+
+SEPARATOR_RE = re.compile(r"\s*,?\s*")
+
+def iter_records(path: str, buffer_size: int = 1 << 16) -> Iterator[Data]:
+    """Stream records from a JSON array or NDJSON file without loading it whole."""
+    with open(path, "r", encoding="utf-8") as handle:
+        head = handle.read(buffer_size)
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            yield from iter_json_array(handle, stripped[1:], buffer_size)
+            return
+        lines = head.split("\n")
+        # The last piece may be a partial line; prepend it to the next read.
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+        for line in handle:
+            if tail:
+                line, tail = tail + line, ""
+            if line.strip():
+                yield json.loads(line)
+        if tail.strip():
+            yield json.loads(tail)
+
+def iter_json_array(handle, buffer: str, buffer_size: int) -> Iterator[Data]:
+    decoder = json.JSONDecoder()
+    pos, eof = 0, False
+    while True:
+        pos = SEPARATOR_RE.match(buffer, pos).end()
+        if pos >= len(buffer) or buffer[pos] != "]":
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                record = end = None
+            # A record cut by the buffer boundary fails to decode; read on.
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise ValueError("Malformed or unterminated JSON array")
+                chunk = handle.read(buffer_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield record
+            pos = end
+            if pos > buffer_size:
+                buffer, pos = buffer[pos:], 0
+        else:
+            return
+
+class BulkLoader:
+    """Chunked load path for large imports into one collection.
+
+    Each chunk is validated, given a reserved id range, written to the WAL
+    as a single batch frame and appended to storage in one write. Indexes,
+    statistics and the expiry index are built once for all loaded keys at
+    the end; the collection's write lock is held for the whole load so no
+    reader sees them half built, and snapshots see the load only once it
+    has finished.
+    """
+
+    def __init__(self, collection, chunk_size: int = 5000):
+        self.collection = collection
+        self.chunk_size = chunk_size
+
+    def load(self, source: Union[str, Iterable[Data]], user_role: str) -> List[str]:
+        collection = self.collection
+        start_time = time.time()
+        collection.security.restrict_access("insert", user_role, collection.name)
+        records = iter_records(source) if isinstance(source, str) else iter(source)
+        keys: List[str] = []
+        with collection.writing():
+            try:
+                while True:
+                    chunk = list(islice(records, self.chunk_size))
+                    if not chunk:
+                        break
+                    keys.extend(self.load_chunk(chunk))
+            finally:
+                # Chunks already in the WAL and storage stay loaded even if a
+                # later chunk fails, so their indexes must be built either way.
+                self.build_indexes(keys)
+                collection.performance.invalidate_cache(collection.name)
+                if keys and not collection.db.storage.incremental:
+                    collection.db.save_db()
+            collection.db.maybe_checkpoint()
+        collection.performance.track_operation("BULK_INSERT", collection.name, start_time)
+        collection.logger.info("Bulk loaded %d records into %s by %s", len(keys), collection.name, user_role)
+        return keys
+
+    def load_chunk(self, chunk: List[Data]) -> List[str]:
+        collection = self.collection
+        for record in chunk:
+            if not isinstance(record, dict):
+                raise ValueError(f"Bulk records must be JSON objects, got {type(record).__name__}")
+            collection.validate_record(record)
+        created_at = collection.current_time()
+        sensitive_fields = collection.sensitive_fields
+        if sensitive_fields:
+            chunk = collection.security.encrypt_records(chunk, sensitive_fields, collection.randomized_fields)
+        stored: Records = {}
+        entries = []
+        for number, record in zip(collection.ids.reserve(len(chunk)), chunk):
+            key = collection.ids.format(number)
+            record = dict(record, _id=key, created_at=created_at)
+            stored[key] = record
+            entries.append({"op_type": "INSERT", "key": key, "data": record})
+        collection.wal.log_bulk(collection.name, entries)
+        collection.versions.install_many(stored)
+        collection.data.update(stored)
+        if collection.db.storage.incremental:
+            collection.db.persist_records(collection, list(stored))
+        return list(stored)
+
+    def build_indexes(self, keys: List[str]):
+        collection = self.collection
+        if not keys:
+            return
+        data = collection.data
+        IndexManager.add_many(keys, data, collection.indexes, collection.ordered_indexes)
+        for compound in collection.compound_indexes.values():
+            compound.add_many(keys, data)
+        if collection.columns is not None:
+            for key in keys:
+                collection.columns.put(key, data[key])
+        for key in keys:
+            collection.expiry.set(key, data[key])
+        collection.stats.rebuild(collection.indexes)
@@ -2,25 +2,31 @@ import argparse
 import json
 import os
 import time
-from typing import List
+from typing import Dict, List, Optional
 from database import MyDB, Collection
-from security import Security
+from client import Client
 from performance import Performance
 from logger import Logger
-from queryParser import parse_my_query
+from queryParser import parse_my_query, compile_query
+from query import QueryAction
 from mydb_types import ExplainPlan
 from utils import MyDBUtils, MyDBUtilsError
 
 class CLI:
-    def __init__(self):
-        self.db = MyDB()
+    def __init__(self, wal_sync: str = "batch", auto_index: bool = False, connect: str = None, policy_file: str = None):
+        # With ``connect`` every command goes to a running server, which keeps
+        # the database loaded between invocations; otherwise it is opened here.
+        self.client = Client(connect) if connect else None
+        self.db = None if self.client else MyDB(wal_sync=wal_sync, auto_index=auto_index, policy_file=policy_file)
         self.collection: Collection = None
-        self.user_role: str = "guest"
+        # None leaves a remote session on the server's default role.
+        self.user_role: Optional[str] = None if self.client else self.db.security.policy.default_role
         self.logger = Logger("CLI", log_file="cli.log")
-        self.security = Security(logger=self.logger)
-        self.performance = Performance()
+        # Cache statistics come from the database's shared query cache.
+        self.performance = Performance(self.db.query_cache if self.db else None)
 
-    def create_collection(self, collection_name: str, schema: str = "", sensitive_fields: List[str] = None, schema_file: str = None):
+    def create_collection(self, collection_name: str, schema: str = "", sensitive_fields: List[str] = None, schema_file: str = None, id_style: str = "int",
+                          randomized_fields: List[str] = None):
         if schema_file:
             try:
                 schema = MyDBUtils.read_json(os.path.join(os.getcwd(), schema_file))
@@ -33,21 +39,41 @@ class CLI:
             except json.JSONDecodeError as e:
                 print(f"Error parsing schema: {e}")
                 return
-        self.collection = Collection(collection_name, schema, sensitive_fields, self.db)
-        self.db.collections[collection_name] = self.collection
-        self.db.save_db()
-        self.logger.info(f"Created collection: {collection_name}")
+        try:
+            if self.client:
+                self.collection = self.client.create_collection(collection_name, schema, sensitive_fields, id_style, randomized_fields)
+            else:
+                self.collection = self.db.create_collection(collection_name, schema, sensitive_fields, id_style, randomized_fields)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        self.logger.info("Created collection: %s", collection_name)
         print(f"Collection '{collection_name}' created successfully")
         if sensitive_fields:
             print(f"Sensitive fields: {sensitive_fields}")
+        if randomized_fields:
+            print(f"Randomized encryption (not filterable): {randomized_fields}")
+
+    def use_collection(self, collection_name: str):
+        try:
+            self.collection = self.client.collection(collection_name) if self.client else self.db.collections[collection_name]
+        except (KeyError, ValueError):
+            print(f"Error: Collection '{collection_name}' not found")
+            return
+        self.logger.info("Using collection: %s", collection_name)
+        print(f"Using collection '{collection_name}'")
+
+    def roles(self) -> Dict[str, Dict[str, List[str]]]:
+        return self.client.list_roles() if self.client else self.db.security.get_roles()
 
     def set_role(self, role: str):
-        if role in ["admin", "user", "guest"]:
+        roles = self.roles()
+        if role in roles:
             self.user_role = role
-            self.logger.info(f"Set role to: {role}")
+            self.logger.info("Set role to: %s", role)
             print(f"User role set to: {role}")
         else:
-            print(f"Error: Invalid role '{role}'. Choose from: admin, user, guest")
+            print(f"Error: Invalid role '{role}'. Choose from: {', '.join(roles)}")
 
     def insert(self, data: str, data_file: str = None):
         if not self.collection:
@@ -69,11 +95,11 @@ class CLI:
         try:
             record_id = self.collection.insert(data, self.user_role)
             self.performance.track_operation("insert", self.collection.name, start_time)
-            self.logger.info(f"Inserted record with _id: {record_id}")
+            self.logger.info("Inserted record with _id: %s", record_id)
             print(f"Inserted record with _id: {record_id}")
             print(f"Record: {data}")
         except Exception as e:
-            self.logger.error(f"Insert failed: {e}")
+            self.logger.error("Insert failed: %s", e)
             print(f"Error: {e}")
 
     def bulk_insert(self, data_file: str):
@@ -81,16 +107,16 @@ class CLI:
             print("Error: No collection selected. Use 'create_collection' first.")
             return
         try:
-            records = MyDBUtils.read_json(os.path.join(os.getcwd(), data_file))
+            # Streams JSON arrays and NDJSON in chunks instead of reading the file whole.
             start_time = time.time()
-            keys = self.collection.bulk_insert(records, self.user_role)
+            keys = self.collection.bulk_load(os.path.join(os.getcwd(), data_file), self.user_role)
             self.performance.track_operation("bulk_insert", self.collection.name, start_time)
-            self.logger.info(f"Bulk inserted {len(keys)} records")
+            self.logger.info("Bulk inserted %d records", len(keys))
             print(f"Bulk inserted {len(keys)} records with IDs: {keys[:5]}...")
-        except MyDBUtilsError as e:
+        except (OSError, json.JSONDecodeError) as e:
             print(f"Error reading data file: {e}")
         except Exception as e:
-            self.logger.error(f"Bulk insert failed: {e}")
+            self.logger.error("Bulk insert failed: %s", e)
             print(f"Error: {e}")
 
     def query(self, query_str: str):
@@ -99,13 +125,19 @@ class CLI:
             return
         start_time = time.time()
         try:
-            results = self.collection.parse_query(query_str, self.user_role)
+            if compile_query(query_str).action == QueryAction.SELECT:
+                # Stream FETCH results row by row instead of building the list.
+                print("[")
+                for i, row in enumerate(self.collection.find_iter(query_str, self.user_role)):
+                    print(("," if i else "") + json.dumps(row, indent=2))
+                print("]")
+            else:
+                results = self.collection.parse_query(query_str, self.user_role)
+                print(json.dumps(results, indent=2))
             self.performance.track_operation("query", self.collection.name, start_time)
-            self.performance.cache_query(query_str, results)
-            self.logger.info(f"Query executed: {query_str}")
-            print(json.dumps(results, indent=2))
+            self.logger.info("Query executed: %s", query_str)
         except Exception as e:
-            self.logger.error(f"Query failed: {e}")
+            self.logger.error("Query failed: %s", e)
             print(f"Error: {e}")
 
     def explain(self, query_str: str):
@@ -114,10 +146,13 @@ class CLI:
             return
         try:
             plan = self.collection.explain(query_str, self.user_role)
-            self.logger.info(f"Explained query: {query_str}")
-            print(f"Query Plan: method={plan['method']}, field={plan['field']}")
+            self.logger.info("Explained query: %s", query_str)
+            print(f"Query Plan: method={plan['method']}, field={plan['field']}" + (f", order={plan['order']}" if "order" in plan else ""))
+            print(f"Rows: estimated={plan.get('estimated_rows')}, actual={plan.get('actual_rows')}")
+            for child in plan.get("children", []):
+                print(f"  {child['method']} on {child['field']}: estimated={child['estimated_rows']}")
         except Exception as e:
-            self.logger.error(f"Explain failed: {e}")
+            self.logger.error("Explain failed: %s", e)
             print(f"Error: {e}")
 
     def update(self, operations: str, data: str):
@@ -130,12 +165,12 @@ class CLI:
             start_time = time.time()
             count = self.collection.update(operations, data, self.user_role)
             self.performance.track_operation("update", self.collection.name, start_time)
-            self.logger.info(f"Updated {count} record(s)")
+            self.logger.info("Updated %d record(s)", count)
             print(f"Updated {count} record(s)")
         except json.JSONDecodeError as e:
             print(f"Error parsing input: {e}")
         except Exception as e:
-            self.logger.error(f"Update failed: {e}")
+            self.logger.error("Update failed: %s", e)
             print(f"Error: {e}")
 
     def delete(self, data: str):
@@ -147,12 +182,12 @@ class CLI:
             start_time = time.time()
             count = self.collection.delete(data, self.user_role)
             self.performance.track_operation("delete", self.collection.name, start_time)
-            self.logger.info(f"Deleted {count} record(s)")
+            self.logger.info("Deleted %d record(s)", count)
             print(f"Deleted {count} record(s)")
         except json.JSONDecodeError as e:
             print(f"Error parsing data: {e}")
         except Exception as e:
-            self.logger.error(f"Delete failed: {e}")
+            self.logger.error("Delete failed: %s", e)
             print(f"Error: {e}")
 
     def transaction(self, operations: str, operations_file: str = None):
@@ -178,23 +213,28 @@ class CLI:
             self.logger.info("Transaction completed successfully" if success else "Transaction failed")
             print("Transaction completed successfully" if success else "Transaction failed")
         except Exception as e:
-            self.logger.error(f"Transaction failed: {e}")
+            self.logger.error("Transaction failed: %s", e)
             print(f"Error: {e}")
 
-    def create_index(self, field: str):
+    def create_index(self, field: str, kind: str = "hash", include: List[str] = None):
         if not self.collection:
             print("Error: No collection selected. Use 'create_collection' first.")
             return
         try:
-            self.collection.create_index(field)
-            self.logger.info(f"Created index on field: {field}")
-            print(f"Index created on field: {field}")
-        except MyDBUtilsError as e:
-            self.logger.error(f"Failed to create index: {e}")
+            fields = [f.strip() for f in field.split(",") if f.strip()]
+            if len(fields) > 1 or include:
+                self.collection.create_compound_index(fields, include, self.user_role)
+                kind = "compound"
+            else:
+                self.collection.create_index(field, kind, self.user_role)
+            self.logger.info("Created %s index on field: %s", kind, field)
+            print(f"Index created on field: {field} ({kind})")
+        except (MyDBUtilsError, ValueError, PermissionError) as e:
+            self.logger.error("Failed to create index: %s", e)
             print(f"Error: {e}")
 
     def list_collections(self):
-        collections = list(self.db.collections.keys())
+        collections = self.client.list_collections() if self.client else list(self.db.collections.keys())
         if collections:
             print("Collections:")
             for collection in collections:
@@ -209,14 +249,19 @@ class CLI:
         sensitive_fields = self.collection.sensitive_fields
         if sensitive_fields:
             print(f"Encryption enabled for fields: {', '.join(sensitive_fields)}")
+            if self.collection.randomized_fields:
+                print(f"Randomized (not filterable): {', '.join(self.collection.randomized_fields)}")
         else:
             print("No fields are encrypted.")
 
     def list_roles(self):
-        roles = self.security.get_roles()
+        roles = self.roles()
         print("Available roles and permissions:")
-        for role, perms in roles.items():
-            print(f" - {role}: {', '.join(perms)}")
+        for role, grants in roles.items():
+            print(f" - {role}: {', '.join(grants.get('*', [])) or 'none'}")
+            for collection, perms in grants.items():
+                if collection != "*":
+                    print(f"     on {collection}: {', '.join(perms) or 'none'}")
 
     def show_audit_log(self, limit: int = 10):
         logs = self.logger.get_recent_logs(limit)
@@ -232,8 +277,24 @@ class CLI:
         self.logger.info("Performance monitoring enabled")
         print("Performance monitoring enabled")
 
+    def advise_indexes(self, apply: bool = False):
+        if not self.collection:
+            print("Error: No collection selected. Use 'create_collection' first.")
+            return
+        advice = self.collection.apply_index_advice() if apply else self.collection.index_advice()
+        self.logger.info("Index advice for %s: %s", self.collection.name, advice)
+        if not advice:
+            print("No index changes advised")
+        for item in advice:
+            verb = "Applied" if apply else "Advise"
+            kind = f" ({item['kind']})" if item["kind"] else ""
+            print(f"{verb}: {item['action']} index on {item['field']}{kind} - {item['reason']}")
+        print(json.dumps(self.collection.index_usage(), indent=2))
+
     def generate_report(self):
         report = self.performance.get_metrics()
+        if self.client:
+            del report["cache_stats"]  # the cache lives in the server process
         self.logger.info("Generated performance report")
         print(json.dumps(report, indent=2))
 
@@ -254,7 +315,8 @@ class CLI:
                     break
                 elif command.lower() == "help":
                     print("Commands:")
-                    print("  create_collection <name> [schema] [--sensitive-fields <fields>] [--schema-file <file>]")
+                    print("  create_collection <name> [schema] [--sensitive-fields <fields>] [--randomized-fields <fields>] [--schema-file <file>] [--id-style int|sortable]")
+                    print("  use <name>")
                     print("  set_role <role>")
                     print("  insert <data> [--data-file <file>]")
                     print("  bulk_insert <data-file>")
@@ -263,12 +325,13 @@ class CLI:
                     print("  update <operations> <data>")
                     print("  delete <data>")
                     print("  transaction <operations> [--operations-file <file>]")
-                    print("  create_index <field>")
+                    print("  create_index <field>[,<field>...] [--ordered | --columnar] [--include <f1,f2>]")
                     print("  list_collections")
                     print("  show_encryption")
                     print("  list_roles")
                     print("  show_audit_log [--limit <n>]")
                     print("  enable_monitoring")
+                    print("  advise_indexes [--apply]")
                     print("  generate_report")
                     print("  exit")
                 else:
@@ -277,7 +340,7 @@ class CLI:
                 print("\nExiting...")
                 break
             except Exception as e:
-                self.logger.error(f"Command failed: {e}")
+                self.logger.error("Command failed: %s", e)
                 print(f"Error: {e}")
 
     def parse_command(self, command: str):
@@ -290,20 +353,30 @@ class CLI:
         if cmd == "create_collection":
             schema = []
             sensitive_fields = []
+            randomized_fields = []
             schema_file = None
+            id_style = "int"
             i = 1
             collection_name = args[0] if args else ""
             while i < len(args):
                 if args[i] == "--sensitive-fields":
                     i += 1
                     sensitive_fields = args[i].split(",") if i < len(args) else []
+                elif args[i] == "--randomized-fields":
+                    i += 1
+                    randomized_fields = args[i].split(",") if i < len(args) else []
+                elif args[i] == "--id-style":
+                    i += 1
+                    id_style = args[i] if i < len(args) else "int"
                 elif args[i] == "--schema-file":
                     i += 1
                     schema_file = args[i] if i < len(args) else None
                 else:
                     schema.append(args[i])
                 i += 1
-            self.create_collection(collection_name, " ".join(schema), sensitive_fields, schema_file)
+            self.create_collection(collection_name, " ".join(schema), sensitive_fields, schema_file, id_style, randomized_fields)
+        elif cmd == "use":
+            self.use_collection(args[0] if args else "")
         elif cmd == "set_role":
             self.set_role(args[0] if args else "")
         elif cmd == "insert":
@@ -356,7 +429,9 @@ class CLI:
                 i += 1
             self.transaction(" ".join(operations), operations_file)
         elif cmd == "create_index":
-            self.create_index(args[0] if args else "")
+            kind = "ordered" if "--ordered" in args[1:] else "columnar" if "--columnar" in args[1:] else "hash"
+            include = args[args.index("--include") + 1].split(",") if "--include" in args[:-1] else None
+            self.create_index(args[0] if args else "", kind, include)
         elif cmd == "list_collections":
             self.list_collections()
         elif cmd == "show_encryption":
@@ -374,6 +449,8 @@ class CLI:
             self.show_audit_log(limit)
         elif cmd == "enable_monitoring":
             self.enable_monitoring()
+        elif cmd == "advise_indexes":
+            self.advise_indexes("--apply" in args)
         elif cmd == "generate_report":
             self.generate_report()
         else:
@@ -382,28 +459,42 @@ class CLI:
 def main():
     parser = argparse.ArgumentParser(description="Generic NoSQL JSON Database CLI")
     parser.add_argument("--interactive", action="store_true", help="Run in interactive mode")
-    parser.add_argument("--command", choices=["create_collection", "set_role", "insert", "bulk_insert", "query", "explain", "update", "delete", "transaction", "create_index", "list_collections", "show_encryption", "list_roles", "show_audit_log", "enable_monitoring", "generate_report"], help="Command to execute")
+    parser.add_argument("--command", choices=["create_collection", "set_role", "insert", "bulk_insert", "query", "explain", "update", "delete", "transaction", "create_index", "list_collections", "show_encryption", "list_roles", "show_audit_log", "enable_monitoring", "advise_indexes", "generate_report"], help="Command to execute")
     parser.add_argument("--collection", help="Collection name")
     parser.add_argument("--schema", help="Collection schema (JSON string, optional)")
     parser.add_argument("--sensitive-fields", help="Comma-separated sensitive fields")
+    parser.add_argument("--randomized-fields", help="Comma-separated sensitive fields to encrypt non-deterministically (not filterable)")
     parser.add_argument("--schema-file", help="Path to schema JSON file")
+    parser.add_argument("--id-style", choices=["int", "sortable"], default="int", help="Record id format for new collections")
     parser.add_argument("--role", help="User role (admin, user, guest)")
     parser.add_argument("--data", help="Data (JSON string)")
     parser.add_argument("--data-file", help="Path to data JSON file")
     parser.add_argument("--query", help="Query string")
     parser.add_argument("--operations", help="Operations (JSON string)")
     parser.add_argument("--operations-file", help="Path to operations JSON file")
-    parser.add_argument("--field", help="Field name for index")
+    parser.add_argument("--field", help="Field name for index (comma-separated for a compound index)")
+    parser.add_argument("--include", help="Comma-separated fields stored in a compound index to cover queries")
+    parser.add_argument("--index-type", choices=["hash", "ordered", "columnar"], default="hash", help="Index type (ordered and columnar support range filters)")
     parser.add_argument("--limit", type=int, default=10, help="Limit for audit log")
+    parser.add_argument("--apply", action="store_true", help="Apply index advice instead of only printing it")
+    parser.add_argument("--auto-index", action="store_true", help="Create and drop indexes automatically from the observed workload")
+    parser.add_argument("--connect", help="Send commands to a running server (host:port or unix:/path) instead of opening the database")
+    parser.add_argument("--wal-sync", choices=["always", "batch", "os"], default="batch", help="WAL durability: fsync every write, group commit, or leave to the OS")
+    parser.add_argument("--policy", help="JSON access policy: role -> collection -> operations (default: $MYDB_POLICY or built-in roles)")
 
     args = parser.parse_args()
-    cli = CLI()
+    cli = CLI(wal_sync=args.wal_sync, auto_index=args.auto_index, connect=args.connect, policy_file=args.policy)
+    if args.role and args.command != "set_role":
+        cli.set_role(args.role)
+    if args.collection and args.command != "create_collection":
+        cli.use_collection(args.collection)
 
     if args.interactive:
         cli.interactive_mode()
     elif args.command:
         if args.command == "create_collection":
-            cli.create_collection(args.collection or "", args.schema or "", args.sensitive_fields.split(",") if args.sensitive_fields else [], args.schema_file)
+            cli.create_collection(args.collection or "", args.schema or "", args.sensitive_fields.split(",") if args.sensitive_fields else [], args.schema_file, args.id_style,
+                              args.randomized_fields.split(",") if args.randomized_fields else [])
         elif args.command == "set_role":
             cli.set_role(args.role or "")
         elif args.command == "insert":
@@ -421,7 +512,7 @@ def main():
         elif args.command == "transaction":
             cli.transaction(args.operations or "", args.operations_file)
         elif args.command == "create_index":
-            cli.create_index(args.field or "")
+            cli.create_index(args.field or "", args.index_type, args.include.split(",") if args.include else None)
         elif args.command == "list_collections":
             cli.list_collections()
         elif args.command == "show_encryption":
@@ -432,6 +523,8 @@ def main():
             cli.show_audit_log(args.limit)
         elif args.command == "enable_monitoring":
             cli.enable_monitoring()
+        elif args.command == "advise_indexes":
+            cli.advise_indexes(args.apply)
         elif args.command == "generate_report":
             cli.generate_report()
         else:
@@ -0,0 +1,252 @@
+import socket
+from contextlib import contextmanager
+from itertools import islice
+from queue import Empty, LifoQueue
+from threading import BoundedSemaphore
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from bulkload import iter_records
+from mydb_types import BulkData, Data, ExplainPlan, Record
+from protocol import Address, ProtocolError, encode_frame, parse_address, recv_message
+
+class RemoteError(Exception):
+    """A server-side failure with no matching local exception type."""
+
+# Server errors are re-raised as the same type where callers already handle it.
+ERROR_TYPES = {
+    "ValueError": ValueError,
+    "PermissionError": PermissionError,
+    "KeyError": KeyError,
+    "TypeError": TypeError,
+    "ProtocolError": ProtocolError,
+}
+
+class Client:
+    """Blocking connection to a MyDB server; the connection is one session.
+
+    A client is not thread-safe: share connections between threads through a
+    ConnectionPool instead.
+    """
+
+    def __init__(self, address: Union[str, Address], role: Optional[str] = None, timeout: Optional[float] = None):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        if isinstance(self.address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(self.address)
+        else:
+            self.sock = socket.create_connection(self.address, timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        self.next_id = 0
+        self.pending: Optional[int] = None  # a row stream not yet read to its end
+        self.role: Optional[str] = None  # the server policy's default role until set_role
+        self.closed = False
+        if role:
+            self.set_role(role)
+
+    def send(self, op: str, args: Dict) -> int:
+        if self.pending is not None:
+            self.drain()
+        self.next_id += 1
+        try:
+            self.sock.sendall(encode_frame({"id": self.next_id, "op": op, "args": args}))
+        except OSError:
+            self.close()
+            raise
+        return self.next_id
+
+    def receive(self, request_id: int) -> Dict:
+        try:
+            response = recv_message(self.reader)
+        except (OSError, ProtocolError):
+            self.close()
+            raise
+        if response.get("id") != request_id:
+            self.close()
+            raise ProtocolError(f"Response {response.get('id')} does not match request {request_id}")
+        if not response.get("ok"):
+            # Raised after the transport checks: PermissionError is an OSError
+            # but leaves the connection usable.
+            self.pending = None
+            raise ERROR_TYPES.get(response.get("type"), RemoteError)(response.get("error"))
+        return response
+
+    def call(self, op: str, **args) -> Any:
+        return self.receive(self.send(op, args)).get("result")
+
+    def stream(self, op: str, **args) -> Iterator[Record]:
+        # Sent eagerly so errors such as a bad role surface on the first read
+        # and requests stay in order even if the caller never iterates.
+        request_id = self.pending = self.send(op, args)
+
+        def rows():
+            while self.pending == request_id:
+                response = self.receive(request_id)
+                if not response.get("more"):
+                    self.pending = None
+                yield from response.get("rows", [])
+        return rows()
+
+    def drain(self):
+        """Discard the rest of an abandoned row stream."""
+        while self.pending is not None:
+            try:
+                response = recv_message(self.reader)
+            except (OSError, ProtocolError):
+                self.close()
+                raise
+            if not response.get("ok") or not response.get("more"):
+                self.pending = None
+
+    def set_role(self, role: str):
+        self.role = self.call("set_role", role=role)
+
+    def use_role(self, role: Optional[str]):
+        if role and role != self.role:
+            self.set_role(role)
+
+    def ping(self) -> bool:
+        return self.call("ping") == "pong"
+
+    def collection(self, name: str) -> 'RemoteCollection':
+        return RemoteCollection(self, self.call("use", collection=name))
+
+    def create_collection(self, name: str, schema: List[str] = None, sensitive_fields: List[str] = None,
+                          id_style: str = "int", randomized_fields: List[str] = None) -> 'RemoteCollection':
+        info = self.call("create_collection", collection=name, schema=schema or [],
+                         sensitive_fields=sensitive_fields or [], id_style=id_style,
+                         randomized_fields=randomized_fields or [])
+        return RemoteCollection(self, info)
+
+    def list_collections(self) -> List[str]:
+        return self.call("list_collections")
+
+    def list_roles(self) -> Dict[str, Dict[str, List[str]]]:
+        return self.call("list_roles")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class RemoteCollection:
+    """Collection stand-in that forwards calls to a server session.
+
+    Methods keep Collection's signatures so callers such as the CLI work
+    unchanged; a ``user_role`` argument switches the session's role.
+    """
+
+    def __init__(self, client: Client, info: Dict):
+        self.client = client
+        self.name = info["name"]
+        self.sensitive_fields = info.get("sensitive_fields", [])
+        self.randomized_fields = info.get("randomized_fields", [])
+
+    def call(self, op: str, user_role: Optional[str] = None, **args) -> Any:
+        self.client.use_role(user_role)
+        return self.client.call(op, collection=self.name, **args)
+
+    def insert(self, record: Data, user_role: str) -> str:
+        return self.call("insert", user_role, data=record)
+
+    def bulk_insert(self, records: BulkData, user_role: str) -> List[str]:
+        return self.call("bulk_insert", user_role, records=records)
+
+    def bulk_load(self, source: Union[str, Iterable[Data]], user_role: str, chunk_size: int = 5000) -> List[str]:
+        # The file is read here and shipped in chunks; the server loads each
+        # chunk through its bulk path.
+        records = iter_records(source) if isinstance(source, str) else iter(source)
+        keys: List[str] = []
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return keys
+            keys.extend(self.bulk_insert(chunk, user_role))
+
+    def parse_query(self, query_str: str, user_role: str) -> List[Record]:
+        return self.call("query", user_role, query=query_str)
+
+    def find_iter(self, query_str: str, user_role: str) -> Iterator[Record]:
+        self.client.use_role(user_role)
+        return self.client.stream("find", collection=self.name, query=query_str)
+
+    def explain(self, query_str: str, user_role: str) -> ExplainPlan:
+        return self.call("explain", user_role, query=query_str)
+
+    def update(self, operations: Dict, update_data: Data, user_role: str) -> int:
+        return self.call("update", user_role, operations=operations, data=update_data)
+
+    def delete(self, query: Dict, user_role: str) -> int:
+        return self.call("delete", user_role, data=query)
+
+    def transaction(self, operations: List[Dict], user_role: str) -> bool:
+        return self.call("transaction", user_role, operations=operations)
+
+    def create_index(self, field: str, kind: str = "hash", user_role: Optional[str] = None):
+        self.call("create_index", user_role, field=field, kind=kind)
+
+    def create_compound_index(self, fields: List[str], include: List[str] = None, user_role: Optional[str] = None):
+        self.call("create_compound_index", user_role, fields=fields, include=include)
+
+    def drop_index(self, field: str, user_role: Optional[str] = None):
+        self.call("drop_index", user_role, field=field)
+
+    def index_advice(self) -> List[Dict]:
+        return self.call("index_advice")
+
+    def apply_index_advice(self) -> List[Dict]:
+        return self.call("apply_index_advice")
+
+    def index_usage(self) -> Dict:
+        return self.call("index_usage")
+
+class ConnectionPool:
+    """Bounded pool of Clients for multi-threaded callers.
+
+    At most ``size`` connections exist; callers beyond that wait for one to be
+    returned. Connections that fail with a socket or protocol error are
+    dropped instead of going back to the pool.
+    """
+
+    def __init__(self, address: Union[str, Address], role: Optional[str] = None, size: int = 8,
+                 timeout: Optional[float] = None):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.role = role
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(size)
+        self.idle: LifoQueue = LifoQueue()
+
+    @contextmanager
+    def connection(self) -> Iterator[Client]:
+        self.slots.acquire()
+        try:
+            try:
+                client = self.idle.get_nowait()
+                client.use_role(self.role)
+            except Empty:
+                client = Client(self.address, self.role, self.timeout)
+            try:
+                yield client
+            finally:
+                if not client.closed:
+                    self.idle.put(client)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                return
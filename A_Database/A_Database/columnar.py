@@ -0,0 +1,157 @@
+from array import array
+from typing import Any, Dict, List, Optional
+from mydb_types import Records, Record, Conditions
+from index import IndexManager
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ColumnStore:
+    """Typed float64 shadow columns for numeric fields of a collection.
+
+    Rows are addressed by position; ``keys[pos]`` maps back to the record id.
+    Each column has a validity map (1 = numeric value present) and deleted
+    rows are cleared in ``live`` until the next compaction. Range filters run
+    as NumPy masks when NumPy is installed and as a tight loop over the
+    arrays otherwise.
+    """
+
+    def __init__(self):
+        self.keys: List[Optional[str]] = []
+        self.positions: Dict[str, int] = {}
+        self.columns: Dict[str, array] = {}
+        self.valid: Dict[str, bytearray] = {}
+        self.live = bytearray()
+        self.dead = 0
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    def add_field(self, field: str, data: Records):
+        if not self.columns:
+            for key in data:
+                self.positions[key] = len(self.keys)
+                self.keys.append(key)
+                self.live.append(1)
+        column = array("d", bytes(8 * len(self.keys)))
+        valid = bytearray(len(self.keys))
+        for pos, key in enumerate(self.keys):
+            record = data.get(key) if key is not None else None
+            number = self._number(record.get(field)) if record is not None else None
+            if number is not None:
+                column[pos] = number
+                valid[pos] = 1
+        self.columns[field] = column
+        self.valid[field] = valid
+
+    def put(self, key: str, record: Record):
+        pos = self.positions.get(key)
+        if pos is None:
+            pos = len(self.keys)
+            self.positions[key] = pos
+            self.keys.append(key)
+            self.live.append(1)
+            for field, column in self.columns.items():
+                number = self._number(record.get(field))
+                column.append(number if number is not None else 0.0)
+                self.valid[field].append(number is not None)
+            return
+        for field, column in self.columns.items():
+            number = self._number(record.get(field))
+            column[pos] = number if number is not None else 0.0
+            self.valid[field][pos] = number is not None
+
+    def remove(self, key: str):
+        pos = self.positions.pop(key, None)
+        if pos is None:
+            return
+        self.keys[pos] = None
+        self.live[pos] = 0
+        self.dead += 1
+        if self.dead > 1024 and self.dead * 2 > len(self.keys):
+            self.compact()
+
+    def compact(self):
+        keep = [pos for pos, alive in enumerate(self.live) if alive]
+        self.keys = [self.keys[pos] for pos in keep]
+        self.positions = {key: pos for pos, key in enumerate(self.keys)}
+        for field in self.columns:
+            column, valid = self.columns[field], self.valid[field]
+            self.columns[field] = array("d", (column[pos] for pos in keep))
+            self.valid[field] = bytearray(valid[pos] for pos in keep)
+        self.live = bytearray(b"\x01" * len(keep))
+        self.dead = 0
+
+    def usable(self, conditions: Conditions) -> List[str]:
+        return [field for field, condition in conditions.items()
+                if field in self.columns and isinstance(condition, dict)
+                and any(op in condition for op in IndexManager.RANGE_OPS)]
+
+    def filter(self, conditions: Conditions) -> List[str]:
+        """Keys whose columns satisfy every range operator on columnar fields.
+
+        Other operators are left to the caller's predicate.
+        """
+        fields = self.usable(conditions)
+        if not self.keys:
+            return []
+        if np is not None:
+            return self._filter_numpy(fields, conditions)
+        positions = None
+        for field in fields:
+            positions = self._filter_python(field, conditions[field], positions)
+        keys = self.keys
+        return [keys[pos] for pos in positions] if positions is not None else []
+
+    def _filter_numpy(self, fields: List[str], conditions: Conditions) -> List[str]:
+        mask = np.frombuffer(self.live, dtype=np.bool_).copy()
+        for field in fields:
+            column = np.frombuffer(self.columns[field], dtype=np.float64)
+            mask &= np.frombuffer(self.valid[field], dtype=np.bool_)
+            for op, bound in conditions[field].items():
+                if op == "$gt":
+                    mask &= column > bound
+                elif op == "$gte":
+                    mask &= column >= bound
+                elif op == "$lt":
+                    mask &= column < bound
+                elif op == "$lte":
+                    mask &= column <= bound
+            del column
+        keys = self.keys
+        return [keys[pos] for pos in np.flatnonzero(mask)]
+
+    def _filter_python(self, field: str, ops: Dict[str, Any], positions: Optional[List[int]]) -> List[int]:
+        low, high = float("-inf"), float("inf")
+        low_strict = high_strict = False
+        for op, bound in ops.items():
+            if op in ("$gt", "$gte") and (bound > low or (bound == low and op == "$gt")):
+                low, low_strict = bound, op == "$gt"
+            elif op in ("$lt", "$lte") and (bound < high or (bound == high and op == "$lt")):
+                high, high_strict = bound, op == "$lt"
+        column, valid, live = self.columns[field], self.valid[field], self.live
+        candidates = range(len(column)) if positions is None else positions
+        result = []
+        append = result.append
+        for pos in candidates:
+            if not (valid[pos] and live[pos]):
+                continue
+            value = column[pos]
+            if value < low or value > high or (low_strict and value == low) or (high_strict and value == high):
+                continue
+            append(pos)
+        return result
+
+    @staticmethod
+    def _number(value: Any) -> Optional[float]:
+        if value is None:
+            return None
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            return None
+        # NaN never satisfies a range predicate, so store it as null.
+        return number if number == number else None
@@ -1,99 +1,414 @@
+import copy
 import os
+import re
 import time
-from datetime import datetime, timedelta
-from threading import Lock
+import heapq
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from threading import Event, Lock, Thread
+from locks import ReadWriteLock
 from mydb_types import Data, Records, Conditions, Indexes, Record, BulkData, ExplainPlan
 from storage import Storage
-from index import IndexManager
+from index import IndexManager, OrderedIndex, CompoundIndex, ExpiryIndex, to_number
+from columnar import ColumnStore
+from ids import IdAllocator
+from bulkload import BulkLoader
+from stats import Statistics
+from mvcc import VersionStore, Snapshot
+from planner import Planner
 from wal import WAL
 from security import Security
-from performance import Performance
+from policy import Policy
+from performance import Performance, QueryCache
 from logger import Logger
 from query import Query, QueryAction
-from queryParser import parse_my_query
+from queryParser import compile_query, compile_predicate, compile_disjunction
 from utils import MyDBUtils, MyDBUtilsError
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Collection names become directory names under the segment engine's root.
+COLLECTION_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def order_key(field: str, descending: bool = False):
+    # Numbers sort numerically ahead of other values, and null/missing
+    # fields sort last in either direction.
+    rank_sign = -1 if descending else 1
+    def key(record: Record):
+        value = record.get(field)
+        if value is None:
+            return (2 * rank_sign, 0.0, "")
+        number = to_number(value)
+        if number is None:
+            return (rank_sign, 0.0, str(value))
+        return (0, number, "")
+    return key
 
 class MyDB:
-    def __init__(self):
+    def __init__(self, engine: str = "segment", wal_sync: str = "batch", checkpoint_interval: int = 1000,
+                 auto_index: bool = False, advisor_interval: float = 60.0, ttl_sweep_interval: float = 1.0,
+                 policy_file: Optional[str] = None):
         self.db_file = "mydb_data.json"
         self.collections: Dict[str, 'Collection'] = {}
         self.lock = Lock()
+        self.checkpoint_lock = Lock()
         self.logger = Logger("MyDB", log_file="mydb.log")
-        self.wal = WAL()
-        if not os.path.exists(self.db_file):
-            Storage.save_db(self.db_file, {})
+        # One Security for every collection: the policy is compiled once and
+        # the field-cipher caches are shared.
+        self.security = Security(self.logger, policy=Policy.load(policy_file))
+        # Likewise one result cache, keyed by collection, so its limits hold
+        # for the whole process.
+        self.query_cache = QueryCache()
+        self.wal = WAL(sync_mode=wal_sync, checkpoint_interval=checkpoint_interval)
+        self.storage = Storage.create_engine(engine, self.db_file)
         self.load_db()
+        # If the log was lost after a checkpoint, new LSNs must still land
+        # above the ones the stored metadata already covers.
+        self.wal.advance_lsn(max((c.checkpoint_lsn for c in self.collections.values()), default=0))
+        self.recover()
+        self.stop_event = Event()
+        self.advisor_thread: Optional[Thread] = None
+        self.sweeper_thread: Optional[Thread] = None
+        if auto_index:
+            self.start_index_advisor(advisor_interval)
+        if ttl_sweep_interval:
+            self.start_expiry_sweeper(ttl_sweep_interval)
 
     def load_db(self):
-        data = Storage.load_db(self.db_file)
+        data = self.storage.load()
+        migrated = False
+        if not data and self.storage.incremental and os.path.exists(self.db_file):
+            # First start on the segment engine: import the legacy single-file database.
+            data = Storage.load_db(self.db_file)
+            migrated = bool(data)
         for collection_name, collection_data in data.items():
             if isinstance(collection_data, dict):
-                self.collections[collection_name] = Collection(
+                collection = Collection(
                     collection_name,
                     collection_data.get("schema", []),
                     collection_data.get("sensitive_fields", []),
                     self,
                     collection_data.get("data", {}),
-                    collection_data.get("indexes", {})
+                    {field: {value: dict.fromkeys(keys) for value, keys in index.items()}
+                     for field, index in collection_data.get("indexes", {}).items()},
+                    collection_data.get("id_style", "int"),
+                    collection_data.get("randomized_fields", [])
                 )
+                collection.ids.observe([collection_data.get("next_id", 1) - 1])
+                for field in collection_data.get("index_fields", []):
+                    if field not in collection.indexes:
+                        IndexManager.build_index(field, collection.data, collection.indexes)
+                for field in collection_data.get("ordered_index_fields", []):
+                    collection.ordered_indexes[field] = IndexManager.build_ordered_index(field, collection.indexes)
+                for field in collection_data.get("columnar_fields", []):
+                    collection.add_column(field)
+                for spec in collection_data.get("compound_indexes", []):
+                    compound = CompoundIndex(spec["fields"], spec.get("include", []))
+                    compound.build(collection.data)
+                    collection.compound_indexes[compound.name] = compound
+                for field, index in collection.indexes.items():
+                    collection.stats.build(field, index)
+                collection.checkpoint_lsn = collection_data.get("checkpoint_lsn", 0)
+                self.collections[collection_name] = collection
+        if migrated:
+            self.save_db()
+            self.logger.info("Migrated %d collections from %s", len(self.collections), self.db_file)
 
     def save_db(self):
-        data = {}
-        for collection_name, collection in self.collections.items():
-            data[collection_name] = {
-                "schema": collection.schema,
-                "sensitive_fields": collection.sensitive_fields,
-                "data": collection.data,
-                "indexes": collection.indexes
-            }
-        Storage.save_db(self.db_file, data)
+        with self.lock:
+            data = {}
+            for collection_name, collection in list(self.collections.items()):
+                # dict() copies are atomic under the GIL and stored records are
+                # replaced rather than mutated, so no collection lock is needed.
+                data[collection_name] = collection.meta()
+                data[collection_name]["data"] = dict(collection.data)
+                data[collection_name]["indexes"] = {f: {value: list(posting) for value, posting in list(index.items())}
+                                                    for f, index in list(collection.indexes.items())}
+            self.storage.save_all(data)
+
+    def recover(self):
+        logs = self.wal.recover()
+        pending: Dict[str, List[Dict]] = {}
+        skipped = 0
+        for log in logs:
+            if log.get("op_type") == "CHECKPOINT":
+                continue
+            collection = self.collections.get(log.get("collection"))
+            if collection is None:
+                skipped += 1
+            elif log.get("lsn", 0) > collection.checkpoint_lsn:
+                if log.get("op_type") == "BATCH":
+                    pending.setdefault(collection.name, []).extend(log["entries"])
+                elif log.get("op_type") == "TRANSACTION":
+                    entries = log["entries"]
+                    if entries and entries[-1].get("op_type") == "COMMIT":
+                        pending.setdefault(collection.name, []).extend(entries[1:-1])
+                else:
+                    pending.setdefault(collection.name, []).append(log)
+        if skipped:
+            self.logger.warning("Skipped %d WAL entries for unknown collections", skipped)
+        for collection_name, entries in pending.items():
+            self.collections[collection_name].recover_from_log(entries)
+        if any(log.get("op_type") != "CHECKPOINT" for log in logs):
+            self.checkpoint()
+
+    def checkpoint(self, blocking: bool = True) -> bool:
+        # All collection write locks are needed so no write sits between its WAL
+        # append and its storage write. A non-blocking attempt never waits, so a
+        # writer that triggers it while holding its own lock cannot deadlock.
+        if not self.checkpoint_lock.acquire(blocking):
+            return False
+        held = []
+        try:
+            for collection in sorted(self.collections.values(), key=lambda c: c.name):
+                if not collection.lock.acquire_write(blocking):
+                    return False
+                held.append(collection)
+            lsn = self.wal.last_lsn
+            for collection in held:
+                collection.checkpoint_lsn = lsn
+            if self.storage.incremental:
+                self.storage.sync()
+                for collection in held:
+                    self.storage.save_meta(collection.name, collection.meta())
+            else:
+                self.save_db()
+                self.storage.sync()
+            self.wal.checkpoint(lsn)
+            return True
+        finally:
+            for collection in held:
+                collection.lock.release_write()
+            self.checkpoint_lock.release()
+
+    def maybe_checkpoint(self):
+        if self.wal.needs_checkpoint():
+            self.checkpoint(blocking=False)
+
+    def join(self, left: 'Collection', query: Query, user_role: str) -> Tuple[Iterator[Dict], ExplainPlan]:
+        right = self.collections.get(query.join_collection)
+        if right is None:
+            raise ValueError(f"Unknown collection: {query.join_collection}")
+        left.security.restrict_access("select", user_role, left.name)
+        right.security.restrict_access("select", user_role, right.name)
+        query = left.bind(query)
+        # A sensitive join key is compared decrypted, so the right side's
+        # index, keyed by the stored ciphertext, cannot be probed.
+        sensitive = query.join_left_field in left.sensitive_fields or query.join_right_field in right.sensitive_fields
+        method = "index_probe" if query.join_right_field in right.indexes and not sensitive else "hash_join"
+        rows = self.join_rows(left, right, query, method)
+        left_plan = next(rows)
+        plan = {
+            "method": method,
+            "field": f"{query.join_left_field}={right.name}.{query.join_right_field}",
+            "left_access": left_plan["method"]
+        }
+        return rows, plan
+
+    def join_rows(self, left: 'Collection', right: 'Collection', query: Query, method: str) -> Iterator:
+        # Left side streams through its own planner (probe side); the right
+        # side is either probed through its existing index or built into a
+        # hash table once. The first item is the left side's plan, made under
+        # the same read locks, which are held until the generator finishes.
+        left_field, right_field = query.join_left_field, query.join_right_field
+        left_key = left.security.reveal_value if left_field in left.sensitive_fields else None
+        right_key = right.security.reveal_value if right_field in right.sensitive_fields else None
+        first, second = sorted((left, right), key=lambda c: c.name)
+        with first.lock.read(), second.lock.read():
+            if method == "index_probe":
+                index, right_data = right.indexes[right_field], right.data
+                lookup = lambda value: [right_data[k] for k in index.get(value, ()) if k in right_data]
+            else:
+                table: Dict[str, List[Record]] = {}
+                for record in right.data.values():
+                    value = record.get(right_field)
+                    if value is not None:
+                        if right_key is not None:
+                            value = right_key(value)
+                        table.setdefault(value, []).append(record)
+                lookup = lambda value: table.get(value, ())
+            keys, left_plan = left.plan(query.conditions, query.disjuncts)
+            yield left_plan
+            matches = left.compile_filter(query.conditions, query.predicate)
+            for record in left.candidates(keys):
+                if not matches(record):
+                    continue
+                value = record.get(left_field)
+                if value is None:
+                    continue
+                if left_key is not None:
+                    value = left_key(value)
+                for other in lookup(value):
+                    if right.is_expired(other):
+                        continue
+                    row = left.security.decrypt_sensitive_fields(record, left.sensitive_fields)
+                    for field, other_value in other.items():
+                        if field in right.sensitive_fields:
+                            other_value = right.security.reveal_value(other_value)
+                        row[field if field not in row else f"{right.name}.{field}"] = other_value
+                    yield row
+
+    def start_index_advisor(self, interval: float = 60.0):
+        # Opt-in auto mode: periodically apply each collection's index advice.
+        if self.advisor_thread is not None:
+            return
+        def run():
+            while not self.stop_event.wait(interval):
+                for collection in list(self.collections.values()):
+                    try:
+                        collection.apply_index_advice()
+                    except Exception as e:
+                        self.logger.error("Index advisor failed for %s: %s", collection.name, e)
+        self.advisor_thread = Thread(target=run, name="mydb-index-advisor", daemon=True)
+        self.advisor_thread.start()
+        self.logger.info("Index advisor running every %ss", interval)
+
+    def start_expiry_sweeper(self, interval: float = 1.0, batch_size: int = 500):
+        # Physically removes expired records so they stop costing scans and storage.
+        if self.sweeper_thread is not None:
+            return
+        def run():
+            while not self.stop_event.wait(interval):
+                for collection in list(self.collections.values()):
+                    try:
+                        while collection.purge_expired(batch_size) == batch_size and not self.stop_event.is_set():
+                            pass
+                        collection.collect_versions()
+                    except Exception as e:
+                        self.logger.error("Expiry sweep failed for %s: %s", collection.name, e)
+        self.sweeper_thread = Thread(target=run, name="mydb-expiry-sweeper", daemon=True)
+        self.sweeper_thread.start()
+
+    def close(self):
+        self.stop_event.set()
+        for thread in (self.advisor_thread, self.sweeper_thread):
+            if thread is not None:
+                thread.join()
+        self.wal.close()
+        self.storage.close()
+
+    def create_collection(self, name: str, schema: List[str] = None, sensitive_fields: List[str] = None,
+                          id_style: str = "int", randomized_fields: List[str] = None) -> 'Collection':
+        if not isinstance(name, str) or not COLLECTION_NAME_RE.match(name):
+            raise ValueError(f"Invalid collection name: {name!r} (use letters, digits, '_' and '-')")
+        unknown = set(randomized_fields or []) - set(sensitive_fields or [])
+        if unknown:
+            raise ValueError(f"Randomized fields must be sensitive fields: {sorted(unknown)}")
+        with self.lock:
+            if name in self.collections:
+                raise ValueError(f"Collection already exists: {name}")
+            collection = Collection(name, schema or [], sensitive_fields, self, id_style=id_style,
+                                    randomized_fields=randomized_fields)
+            self.collections[name] = collection
+        self.save_meta(collection)
+        self.logger.info("Created collection: %s", name)
+        return collection
+
+    def save_meta(self, collection: 'Collection'):
+        if not self.storage.incremental:
+            self.save_db()
+            return
+        self.storage.save_meta(collection.name, collection.meta())
+
+    def persist_record(self, collection: 'Collection', key: str):
+        if not self.storage.incremental:
+            self.save_db()
+            return
+        self.storage.put(collection.name, key, collection.data[key])
+        self.maybe_compact(collection)
+
+    def persist_records(self, collection: 'Collection', keys: List[str]):
+        if not self.storage.incremental:
+            self.save_db()
+            return
+        self.storage.put_many(collection.name, {key: collection.data[key] for key in keys})
+        self.maybe_compact(collection)
+
+    def remove_records(self, collection: 'Collection', keys: List[str]):
+        if not self.storage.incremental:
+            self.save_db()
+            return
+        self.storage.delete_many(collection.name, keys)
+        self.maybe_compact(collection)
+
+    def maybe_compact(self, collection: 'Collection'):
+        if self.storage.needs_compaction(collection.name, len(collection.data)):
+            self.storage.compact(collection.name, collection.data)
+            self.logger.info("Compacted segments for %s", collection.name)
 
 class Collection:
-    def __init__(self, name: str, schema: List[str], sensitive_fields: List[str], db: MyDB, data: Records = None, indexes: Indexes = None):
+    def __init__(self, name: str, schema: List[str], sensitive_fields: List[str], db: MyDB, data: Records = None,
+                 indexes: Indexes = None, id_style: str = "int", randomized_fields: List[str] = None):
         self.name = name
         self.schema = schema  # Optional schema hints
         self.sensitive_fields = sensitive_fields or []
+        # Sensitive fields encrypted non-deterministically: safer, but they
+        # cannot be filtered or indexed. The rest support equality lookups.
+        self.randomized_fields = randomized_fields or []
         self.db = db
         self.data = data or {}
         self.indexes = indexes or {}
-        self.lock = db.lock
+        self.ordered_indexes: Dict[str, OrderedIndex] = {}
+        self.compound_indexes: Dict[str, CompoundIndex] = {}
+        self.columns: Optional[ColumnStore] = None
+        self.ids = IdAllocator(id_style)
+        self.ids.observe(self.data)
+        self.expiry = ExpiryIndex()
+        for key, record in self.data.items():
+            self.expiry.set(key, record)
+        self.stats = Statistics()
+        self.planner = Planner(self)
+        self.lock = ReadWriteLock()
+        self.versions = VersionStore(self.data)
         self.logger = db.logger
-        self.security = Security(self.logger)
-        self.performance = Performance()
+        self.security = db.security
+        self.performance = Performance(db.query_cache)
         self.performance.start_monitoring()
         self.wal = db.wal
         self.explain_plan: ExplainPlan = {"method": "full_scan", "field": None}
-        self.recover_from_log()
+        self.checkpoint_lsn = 0
 
-    def recover_from_log(self):
-        logs = self.wal.recover()
-        if not logs:
-            return
-        self.logger.info(f"Recovering {self.name} from log...")
+    def recover_from_log(self, logs: List[Dict]):
+        # INSERT and UPDATE entries carry the full stored record, so replay is
+        # a keyed overwrite and safe to repeat for entries storage already has.
+        self.logger.info("Recovering %s from %d log entries...", self.name, len(logs))
+        upserted, deleted = set(), set()
         for log in logs:
             op_type = log["op_type"]
             key = log["key"]
-            log_data = log["data"] or {}
-            conditions = log["conditions"] or {}
-            if op_type == "INSERT" and key:
-                self.data[key] = self.security.encrypt_sensitive_fields(log_data, self.sensitive_fields)
-                self.data[key]["_id"] = key
-                self.data[key]["created_at"] = self.current_time()
-            elif op_type == "UPDATE":
-                for k, record in self.data.items():
-                    if self.match_query(record, conditions, check_ttl=False):
-                        record.update(log_data)
-                        record["updated_at"] = self.current_time()
-            elif op_type == "DELETE":
-                to_delete = [k for k, r in self.data.items() if self.match_query(r, conditions, check_ttl=False)]
-                for k in to_delete:
-                    del self.data[k]
-        self.save_data()
-        for field in self.indexes:
-            IndexManager.build_index(field, self.data, self.indexes)
-        self.wal.clear()
-        self.logger.info(f"Recovery complete for {self.name}")
+            if not key:
+                continue
+            self.ids.observe([key])
+            if op_type in ("INSERT", "UPDATE") and log["data"]:
+                self.index_record(key, log["data"])
+                self.data[key] = log["data"]
+                upserted.add(key)
+                deleted.discard(key)
+            elif op_type == "DELETE" and key in self.data:
+                self.unindex_records([key])
+                del self.data[key]
+                deleted.add(key)
+                upserted.discard(key)
+        self.performance.invalidate_cache(self.name)
+        if self.db.storage.incremental:
+            self.db.persist_records(self, list(upserted))
+            self.db.remove_records(self, list(deleted))
+        self.logger.info("Recovery complete for %s", self.name)
+
+    @contextmanager
+    def writing(self):
+        # Changes made inside become visible to snapshots together on exit.
+        with self.lock.write(), self.versions.write():
+            yield
+
+    def snapshot(self) -> Snapshot:
+        return self.versions.snapshot()
+
+    def collect_versions(self) -> int:
+        if not self.versions.versions:
+            return 0
+        with self.lock.write():
+            return self.versions.collect()
 
     def current_time(self) -> str:
         return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
@@ -108,199 +423,599 @@ class Collection:
         if self.schema:
             for field in record:
                 if field not in self.schema and field not in ["ttl", "updated_at"]:
-                    self.logger.warning(f"Field {field} not in schema: {self.schema}")
+                    self.logger.warning("Field %s not in schema: %s", field, self.schema)
         return True
 
     def is_expired(self, record: Record) -> bool:
-        if "ttl" not in record or "created_at" not in record:
-            return False
-        ttl = float(record["ttl"])
-        created = self.parse_time(record["created_at"])
-        return datetime.now() >= created + timedelta(seconds=ttl)
+        return self.expiry.is_expired(record.get("_id"), time.time())
 
     def match_query(self, record: Record, query: Dict, check_ttl: bool = True) -> bool:
         if check_ttl and self.is_expired(record):
             return False
-        for key, condition in query.items():
-            record_value = record.get(key)
+        return compile_predicate(query)(record)
+
+    def compile_filter(self, conditions: Conditions, predicate=None, check_ttl: bool = True):
+        predicate = predicate or compile_predicate(conditions)
+        if not check_ttl or not self.expiry.expires:
+            return predicate
+        # One clock reading per query; expiry is a dict lookup, not a date parse.
+        expires, now = self.expiry.expires, time.time()
+        def matches(record: Record) -> bool:
+            if not predicate(record):
+                return False
+            expiry = expires.get(record.get("_id"))
+            return expiry is None or expiry > now
+        return matches
+
+    def protect_conditions(self, conditions: Conditions) -> Conditions:
+        """Conditions with literals on deterministic sensitive fields encrypted.
+
+        Those fields are stored as deterministic ciphertext, so equality, $ne
+        and $in compare (and probe hash indexes) against the encrypted
+        literal. Range operators and randomized fields cannot match.
+        """
+        if not self.sensitive_fields:
+            return conditions
+        fields = [field for field in conditions
+                  if field in self.sensitive_fields and field not in self.randomized_fields]
+        if not fields:
+            return conditions
+        protect = self.security.protect_value
+        protected = dict(conditions)
+        for field in fields:
+            condition = conditions[field]
             if isinstance(condition, str):
-                if record_value != condition:
-                    return False
+                protected[field] = protect(condition)
             elif isinstance(condition, dict):
-                ops = condition
-                if record_value is None:
-                    return False
-                try:
-                    record_num = float(record_value)
-                except (ValueError, TypeError):
-                    return False
-                for op, value in ops.items():
-                    if op == "$gt" and not (record_num > value):
-                        return False
-                    elif op == "$gte" and not (record_num >= value):
-                        return False
-                    elif op == "$lt" and not (record_num < value):
-                        return False
-                    elif op == "$lte" and not (record_num <= value):
-                        return False
-                    elif op == "$in" and record_value not in value:
-                        return False
-        return True
+                condition = dict(condition)
+                if "$ne" in condition:
+                    condition["$ne"] = protect(condition["$ne"])
+                if "$in" in condition:
+                    condition["$in"] = [protect(value) for value in condition["$in"]]
+                protected[field] = condition
+        return protected
+
+    def bind(self, query: Query) -> Query:
+        # Compiled queries are shared, so protected literals go on a copy
+        # with its own predicate.
+        conditions = self.protect_conditions(query.conditions)
+        disjuncts = [self.protect_conditions(branch) for branch in query.disjuncts]
+        if conditions is query.conditions and all(new is old for new, old in zip(disjuncts, query.disjuncts)):
+            return query
+        bound = copy.copy(query)
+        bound.conditions, bound.disjuncts = conditions, disjuncts
+        bound.predicate = compile_disjunction(disjuncts) if disjuncts else compile_predicate(conditions)
+        return bound
 
     def insert(self, record: Data, user_role: str) -> str:
         start_time = time.time()
-        with self.lock:
+        with self.writing():
             self.security.restrict_access("insert", user_role, self.name)
             self.validate_record(record)
-            key = str(len(self.data) + 1)
+            key = self.ids.allocate()
             record = record.copy()
             record["_id"] = key
             record["created_at"] = self.current_time()
-            record = self.security.encrypt_sensitive_fields(record, self.sensitive_fields)
-            self.wal.log("INSERT", key, record)
+            record = self.security.encrypt_sensitive_fields(record, self.sensitive_fields, self.randomized_fields)
+            self.wal.log("INSERT", key, record, collection=self.name)
+            self.index_record(key, record)
             self.data[key] = record
-            for field in self.indexes:
-                IndexManager.build_index(field, self.data, self.indexes)
-            self.save_data()
+            self.performance.invalidate_cache(self.name)
+            self.db.persist_record(self, key)
+            self.db.maybe_checkpoint()
             self.performance.track_operation("INSERT", self.name, start_time)
-            self.logger.info(f"Inserted record with ID: {key} by {user_role}")
+            self.logger.info("Inserted record with ID: %s by %s", key, user_role)
             return key
 
     def bulk_insert(self, records: BulkData, user_role: str) -> List[str]:
-        start_time = time.time()
-        with self.lock:
-            self.security.restrict_access("insert", user_role, self.name)
-            keys = []
-            for record in records:
-                self.validate_record(record)
-                key = str(len(self.data) + 1)
-                record = record.copy()
-                record["_id"] = key
-                record["created_at"] = self.current_time()
-                record = self.security.encrypt_sensitive_fields(record, self.sensitive_fields)
-                self.wal.log("INSERT", key, record)
-                self.data[key] = record
-                keys.append(key)
-            for field in self.indexes:
-                IndexManager.build_index(field, self.data, self.indexes)
-            self.save_data()
-            self.performance.track_operation("BULK_INSERT", self.name, start_time)
-            self.logger.info(f"Bulk inserted {len(keys)} records by {user_role}")
-            return keys
+        return self.bulk_load(records, user_role)
+
+    def bulk_load(self, source, user_role: str, chunk_size: int = 5000) -> List[str]:
+        """Load records from a list/iterable or a JSON array / NDJSON file path."""
+        return BulkLoader(self, chunk_size).load(source, user_role)
+
+    def index_record(self, key: str, record: Record):
+        old_record = self.data.get(key)
+        self.versions.install(key, old_record, record)
+        if old_record is not None:
+            IndexManager.update(key, old_record, record, self.indexes, self.ordered_indexes)
+        else:
+            IndexManager.add(key, record, self.indexes, self.ordered_indexes)
+        if self.columns is not None:
+            self.columns.put(key, record)
+        self.expiry.set(key, record)
+        for compound in self.compound_indexes.values():
+            if old_record is not None:
+                compound.update(key, old_record, record)
+            else:
+                compound.add(key, record)
+        self.stats.update(old_record, record)
+        if self.stats.needs_rebuild(len(self.data)):
+            self.stats.rebuild(self.indexes)
+
+    def unindex_records(self, keys: List[str]):
+        IndexManager.remove_many(keys, self.data, self.indexes, self.ordered_indexes)
+        for key in keys:
+            self.expiry.discard(key)
+            record = self.data.get(key)
+            if record is not None:
+                self.versions.install(key, record, None)
+                for compound in self.compound_indexes.values():
+                    compound.remove(key, record)
+                self.stats.update(record, None)
+        if self.columns is not None:
+            for key in keys:
+                self.columns.remove(key)
+
+    def add_column(self, field: str):
+        if self.columns is None:
+            self.columns = ColumnStore()
+        if field not in self.columns.columns:
+            self.columns.add_field(field, self.data)
+
+    def plan(self, conditions: Conditions, disjuncts: List[Conditions] = None,
+             needed: List[str] = None) -> Tuple[Optional[List[str]], ExplainPlan]:
+        # The chosen path only narrows the candidate set; the compiled filter
+        # still checks every condition.
+        return self.planner.plan(conditions, disjuncts, needed)
+
+    @staticmethod
+    def needed_fields(query: Query) -> Optional[List[str]]:
+        # Fields a query reads besides its filter, or None for whole records.
+        if query.action == QueryAction.AGGREGATE:
+            return [field for _, field in query.aggregates if field != "*"] + query.group_by
+        if query.fields:
+            return query.fields + ([query.order_by] if query.order_by else [])
+        return None
+
+    def source(self, keys: Optional[List[str]], plan: ExplainPlan):
+        if plan["method"] == "index_only":
+            return self.compound_indexes[plan["field"]].rows(keys)
+        return self.candidates(keys)
+
+    def execute(self, query: Query, snapshot: Optional[Snapshot] = None) -> Tuple[List[Record], ExplainPlan]:
+        """Plan and run a FETCH or AGGREGATE query.
+
+        With a snapshot only planning holds the read lock; rows are then read
+        at the snapshot's versions, so a long scan does not hold up writers.
+        Plans that walk live index structures still run under the lock.
+        """
+        query = self.bind(query)
+        matches = self.compile_filter(query.conditions, query.predicate)
+        with self.lock.read():
+            keys, plan = self.plan(query.conditions, query.disjuncts, self.needed_fields(query))
+            walk = self.index_walk(keys, query, plan)
+            if snapshot is None or walk or plan["method"] == "index_only":
+                return self.produce(query, self.source(keys, plan), matches, plan, walk)
+            records = snapshot.source(keys)
+        plan["snapshot"] = snapshot.ts
+        return self.produce(query, records, matches, plan)
+
+    def produce(self, query: Query, records, matches, plan: ExplainPlan,
+                walk: bool = False) -> Tuple[List[Record], ExplainPlan]:
+        if query.action == QueryAction.AGGREGATE:
+            plan["aggregate"] = "hash_group" if query.group_by else "single_pass"
+            results = self.aggregate(query, records, matches)
+        else:
+            if query.order_by:
+                records = self.order(records, matches, query, plan, walk)
+            results = list(self.rows(records, matches, query))
+        plan["actual_rows"] = len(results)
+        self.performance.record_filter(self.name, self.filter_conditions(query), plan, len(self.data))
+        return results, plan
+
+    def index_walk(self, keys: Optional[List[str]], query: Query, plan: ExplainPlan) -> bool:
+        # Without a narrowing index an ordered index yields rows already in order.
+        return (query.action == QueryAction.SELECT and keys is None
+                and bool(query.order_by) and query.order_by in self.ordered_indexes)
+
+    @staticmethod
+    def filter_conditions(query: Query) -> Conditions:
+        if query.disjuncts:
+            merged = {}
+            for branch in query.disjuncts:
+                merged.update(branch)
+            return merged
+        return query.conditions
+
+    def order(self, records, matches, query: Query, plan: ExplainPlan, walk: bool = False):
+        # An ordered index walk (see index_walk) yields rows already in order;
+        # otherwise LIMIT k keeps a k-sized heap instead of sorting.
+        field, descending = query.order_by, query.descending
+        if walk:
+            plan["order"] = "index_order"
+            return self.ordered_walk(field, descending)
+        records = (record for record in records if matches(record))
+        key = order_key(field, descending)
+        if query.limit is not None:
+            plan["order"] = "top_k_heap"
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            return pick(query.offset + query.limit, records, key=key)
+        plan["order"] = "sort"
+        return sorted(records, key=key, reverse=descending)
+
+    def ordered_walk(self, field: str, descending: bool) -> Iterator[Record]:
+        # Same order as order_key: numbers, then other values, then rows
+        # where the field is null or missing.
+        data, index = self.data, self.indexes[field]
+        numbers = self.ordered_indexes[field].values
+        others = sorted((value for value in index if value is not None and to_number(value) is None), key=str)
+        for values in (numbers, others):
+            for value in (reversed(values) if descending else values):
+                for key in index.get(value, ()):
+                    if key in data:
+                        yield data[key]
+        for key in index.get(None, ()):
+            if key in data:
+                yield data[key]
+        for record in data.values():
+            if field not in record:
+                yield record
+
+    def rows(self, records, matches, query: Query) -> Iterator[Record]:
+        # Applies OFFSET/LIMIT/FIELDS while streaming, so scanning stops as
+        # soon as the limit is met and only projected fields are decrypted.
+        skip, remaining = query.offset, query.limit
+        if remaining == 0:
+            return
+        for record in records:
+            if not matches(record):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            yield self.project(record, query.fields)
+            if remaining is not None:
+                remaining -= 1
+                if not remaining:
+                    return
+
+    def project(self, record: Record, fields: List[str]) -> Record:
+        # Output rows are fresh dicts; only the sensitive fields they carry
+        # are decrypted.
+        if fields:
+            record = {field: record[field] for field in fields if field in record}
+        else:
+            record = record.copy()
+        if not self.sensitive_fields:
+            return record
+        return self.security.reveal_fields(record, self.sensitive_fields)
+
+    def find_iter(self, query_str: str, user_role: str, batch_size: int = 500) -> Iterator[Record]:
+        """Lazily yield the rows of a FETCH query.
+
+        The cursor reads a snapshot taken when it opens, so it needs no lock
+        while rows are produced and sees none of the writes made meanwhile.
+        Covering-index plans read the live index in batches, each under a
+        short read lock. Close the cursor to release its snapshot early.
+        """
+        self.security.restrict_access("select", user_role, self.name)
+        query = compile_query(query_str)
+        if query.action != QueryAction.SELECT:
+            raise ValueError("Invalid query: find_iter only supports FETCH")
+        query = self.bind(query)
+        matches = self.compile_filter(query.conditions, query.predicate)
+        with self.snapshot() as snapshot:
+            with self.lock.read():
+                keys, plan = self.plan(query.conditions, query.disjuncts, self.needed_fields(query))
+                self.explain_plan = plan
+                self.performance.record_filter(self.name, self.filter_conditions(query), plan, len(self.data))
+                walk = self.index_walk(keys, query, plan)
+                if walk:
+                    rows = list(self.rows(self.order((), matches, query, plan, walk), matches, query))
+                elif plan["method"] == "index_only":
+                    keys = list(self.data) if keys is None else keys
+                else:
+                    records = snapshot.source(keys)
+            if walk:
+                yield from rows
+                return
+            if plan["method"] == "index_only":
+                rows = self.rows(self.source(keys, plan), matches, query)
+                while True:
+                    with self.lock.read():
+                        batch = list(islice(rows, batch_size))
+                    yield from batch
+                    if len(batch) < batch_size:
+                        return
+            if query.order_by:
+                # Ordering needs the whole candidate set anyway; with LIMIT the
+                # materialised result is only k rows.
+                records = self.order(records, matches, query, plan)
+            yield from self.rows(records, matches, query)
+
+    def candidates(self, keys: Optional[List[str]]):
+        if keys is None:
+            return self.data.values()
+        data = self.data
+        return (data[key] for key in keys if key in data)
+
+    def aggregate(self, query: Query, records, matches) -> List[Dict]:
+        # One streaming pass; each group keeps [rows, non_null, numeric, sum,
+        # min, max] per aggregate instead of materialising its records.
+        # Sensitive values are decrypted first: arithmetic on ciphertext is
+        # meaningless and randomized ciphertext never repeats.
+        groups: Dict[tuple, List[List]] = {}
+        aggregates = query.aggregates
+        group_by = query.group_by
+        reveal = self.security.reveal_value
+        sensitive = set(self.sensitive_fields)
+        revealed_groups = [field in sensitive for field in group_by]
+        revealed_values = [func != "COUNT" and field in sensitive for func, field in aggregates]
+        for record in records:
+            if not matches(record):
+                continue
+            group_key = tuple(reveal(record.get(field)) if revealed else record.get(field)
+                              for field, revealed in zip(group_by, revealed_groups))
+            states = groups.get(group_key)
+            if states is None:
+                states = groups[group_key] = [[0, 0, 0, 0.0, None, None] for _ in aggregates]
+            for (func, field), revealed, state in zip(aggregates, revealed_values, states):
+                state[0] += 1
+                if field == "*":
+                    continue
+                value = record.get(field)
+                if value is None:
+                    continue
+                state[1] += 1
+                if func == "COUNT":
+                    continue
+                if revealed:
+                    value = reveal(value)
+                try:
+                    number = float(value)
+                except (ValueError, TypeError):
+                    continue
+                state[2] += 1
+                state[3] += number
+                if state[4] is None or number < state[4]:
+                    state[4] = number
+                if state[5] is None or number > state[5]:
+                    state[5] = number
+        if not groups and not group_by:
+            groups[()] = [[0, 0, 0, 0.0, None, None] for _ in aggregates]
+        results = []
+        for group_key, states in groups.items():
+            row = dict(zip(group_by, group_key))
+            for (func, field), (rows, non_null, numeric, total, low, high) in zip(aggregates, states):
+                name = "count" if field == "*" else f"{func.lower()}_{field}"
+                if func == "COUNT":
+                    row[name] = rows if field == "*" else non_null
+                elif func == "SUM":
+                    row[name] = total if numeric else None
+                elif func == "AVG":
+                    row[name] = total / numeric if numeric else None
+                elif func == "MIN":
+                    row[name] = low
+                elif func == "MAX":
+                    row[name] = high
+            results.append(row)
+        return results
 
     def parse_query(self, query_str: str, user_role: str) -> List[Record]:
         start_time = time.time()
-        with self.lock:
-            self.security.restrict_access("select", user_role, self.name)
-            cached = self.performance.get_cached_query(query_str)
-            if cached is not None:
-                self.performance.track_operation("SELECT_CACHED", self.name, start_time)
-                return cached
-            query = parse_my_query(query_str)
-            results = []
-            indexed = False
-            self.explain_plan = {"method": "full_scan", "field": None}
-
-            if query.filter:
-                field = query.filter.get("field")
-                self.performance.suggest_index(self.name, field)
-                if field in self.indexes and query.filter["type"] == "compare" and query.filter["operator"] == "=":
-                    self.explain_plan = {"method": "index", "field": field}
-                    value = query.filter["value"]
-                    if value in self.indexes[field]:
-                        for key in self.indexes[field][value]:
-                            record = self.data.get(key)
-                            if record and self.match_query(record, query.conditions):
-                                results.append(self.security.decrypt_sensitive_fields(record, self.sensitive_fields))
-                        indexed = True
-
-            if not indexed:
-                for key, record in self.data.items():
-                    if self.match_query(record, query.conditions):
-                        results.append(self.security.decrypt_sensitive_fields(record, self.sensitive_fields))
-
-            self.performance.cache_query(query_str, results)
-            self.performance.track_operation("SELECT", self.name, start_time)
+        query = compile_query(query_str)
+        if query.action == QueryAction.INDEX:
+            if len(query.index_fields) > 1 or query.index_include:
+                self.create_compound_index(query.index_fields, query.index_include, user_role)
+            else:
+                self.create_index(query.index_field, query.index_kind, user_role)
+            return []
+        if query.action == QueryAction.EXPLAIN:
+            return [self.explain(query_str, user_role)]
+        if query.action == QueryAction.JOIN:
+            rows, self.explain_plan = self.db.join(self, query, user_role)
+            results = list(rows)
+            self.performance.track_operation("JOIN", self.name, start_time)
             return results
+        self.security.restrict_access("select", user_role, self.name)
+        cache_version = self.performance.cache_version(self.name)
+        cached = self.performance.get_cached_query(self.name, query_str)
+        if cached is not None:
+            self.performance.track_operation("SELECT_CACHED", self.name, start_time)
+            return cached
+        with self.snapshot() as snapshot:
+            results, self.explain_plan = self.execute(query, snapshot)
+        self.performance.cache_query(self.name, query_str, results, cache_version)
+        self.performance.track_operation("SELECT", self.name, start_time)
+        return results
 
     def explain(self, query_str: str, user_role: str) -> ExplainPlan:
         start_time = time.time()
-        with self.lock:
-            self.security.restrict_access("select", user_role, self.name)
-            self.parse_query(query_str, user_role)  # Sets explain_plan
-            self.performance.track_operation("EXPLAIN", self.name, start_time)
-            self.logger.info(f"Explained query: {query_str}")
-            return self.explain_plan
+        self.security.restrict_access("select", user_role, self.name)
+        query = compile_query(query_str)
+        # The query runs once; the plan carries the planner's estimate and the
+        # row count that execution actually produced.
+        if query.action == QueryAction.JOIN:
+            rows, plan = self.db.join(self, query, user_role)
+            plan["actual_rows"] = sum(1 for _ in rows)
+        else:
+            with self.snapshot() as snapshot:
+                _, plan = self.execute(query, snapshot)
+        self.explain_plan = plan
+        self.performance.track_operation("EXPLAIN", self.name, start_time)
+        self.logger.info("Explained query: %s", query_str)
+        return plan
 
     def update(self, operations: Dict, update_data: Data, user_role: str) -> int:
         start_time = time.time()
-        with self.lock:
+        with self.writing():
             self.security.restrict_access("update", user_role, self.name)
-            count = 0
+            changes = {}
+            matches = self.compile_filter(self.protect_conditions(operations))
             for key, record in self.data.items():
-                if self.match_query(record, operations):
-                    self.wal.log("UPDATE", key, update_data, operations)
-                    record.update(update_data)
-                    record["updated_at"] = self.current_time()
-                    record = self.security.encrypt_sensitive_fields(record, self.sensitive_fields)
-                    self.data[key] = record
-                    count += 1
+                if matches(record):
+                    new_record = record.copy()
+                    new_record.update(self.security.encrypt_sensitive_fields(update_data, self.sensitive_fields,
+                                                                             self.randomized_fields))
+                    new_record["updated_at"] = self.current_time()
+                    changes[key] = new_record
+            # One WAL batch per statement: a single write and sync however many rows match.
+            self.wal.log_batch([{"op_type": "UPDATE", "key": key, "data": new_record, "conditions": operations,
+                                 "collection": self.name} for key, new_record in changes.items()])
+            for key, new_record in changes.items():
+                self.index_record(key, new_record)
+                self.data[key] = new_record
+            updated = list(changes)
+            count = len(updated)
             if count > 0:
-                for field in self.indexes:
-                    IndexManager.build_index(field, self.data, self.indexes)
-                self.save_data()
+                self.performance.invalidate_cache(self.name)
+                self.db.persist_records(self, updated)
+                self.db.maybe_checkpoint()
             self.performance.track_operation("UPDATE", self.name, start_time)
-            self.logger.info(f"Updated {count} records by {user_role}")
+            self.logger.info("Updated %d records by %s", count, user_role)
             return count
 
     def delete(self, query: Dict, user_role: str) -> int:
         start_time = time.time()
-        with self.lock:
+        with self.writing():
             self.security.restrict_access("delete", user_role, self.name)
-            to_delete = [key for key, record in self.data.items() if self.match_query(record, query)]
+            matches = self.compile_filter(self.protect_conditions(query))
+            to_delete = [key for key, record in self.data.items() if matches(record)]
+            self.wal.log_batch([{"op_type": "DELETE", "key": key, "data": None, "conditions": query, "collection": self.name}
+                                for key in to_delete])
+            self.unindex_records(to_delete)
             for key in to_delete:
-                self.wal.log("DELETE", key, conditions=query)
                 del self.data[key]
             if to_delete:
-                for field in self.indexes:
-                    IndexManager.build_index(field, self.data, self.indexes)
-                self.save_data()
+                self.performance.invalidate_cache(self.name)
+                self.db.remove_records(self, to_delete)
+                self.db.maybe_checkpoint()
             self.performance.track_operation("DELETE", self.name, start_time)
-            self.logger.info(f"Deleted {len(to_delete)} records by {user_role}")
+            self.logger.info("Deleted %d records by %s", len(to_delete), user_role)
             return len(to_delete)
 
+    def purge_expired(self, batch_size: int = 500) -> int:
+        """Delete up to batch_size expired records in one WAL batch."""
+        next_expiry = self.expiry.next_expiry()
+        if next_expiry is None or next_expiry > time.time():
+            return 0
+        start_time = time.time()
+        with self.writing():
+            keys = [key for key in self.expiry.due(time.time(), batch_size) if key in self.data]
+            if not keys:
+                return 0
+            self.wal.log_batch([{"op_type": "DELETE", "key": key, "data": None, "conditions": None, "collection": self.name}
+                                for key in keys])
+            self.unindex_records(keys)
+            for key in keys:
+                del self.data[key]
+            self.performance.invalidate_cache(self.name)
+            self.db.remove_records(self, keys)
+            self.db.maybe_checkpoint()
+            self.performance.track_operation("EXPIRE", self.name, start_time)
+            self.logger.info("Expired %d records from %s", len(keys), self.name)
+            return len(keys)
+
     def transaction(self, operations: List[Dict], user_role: str) -> bool:
         from transaction import Transaction
         start_time = time.time()
-        with self.lock:
-            self.security.restrict_access("transaction", user_role, self.name)
-            tx = Transaction(self)
+        self.security.restrict_access("transaction", user_role, self.name)
+        # Staging runs against a snapshot without locks; commit validates and
+        # applies under the write lock.
+        tx = Transaction(self)
+        try:
+            for op in operations:
+                op_type = op.get("type")
+                if op_type == "insert":
+                    tx.insert(op.get("data", {}), user_role)
+                elif op_type == "update":
+                    tx.update(op.get("conditions", {}), op.get("data", {}), user_role)
+                elif op_type == "delete":
+                    tx.delete(op.get("conditions", {}), user_role)
+            tx.commit()
+            self.performance.track_operation("TRANSACTION", self.name, start_time)
+            self.logger.info("Transaction committed by %s", user_role)
+            return True
+        except Exception as e:
+            tx.rollback()
+            self.performance.track_operation("TRANSACTION_FAILED", self.name, start_time)
+            self.logger.error("Transaction failed: %s", e)
+            return False
+
+    def create_index(self, field: str, kind: str = "hash", user_role: Optional[str] = None):
+        # Requests on behalf of a user are checked like queries; the index
+        # advisor and metadata loading build indexes without a role.
+        start_time = time.time()
+        if user_role is not None:
+            self.security.restrict_access("select", user_role, self.name)
+        if kind not in ("hash", "ordered", "columnar"):
+            raise ValueError(f"Unknown index type: {kind}")
+        with self.lock.write():
+            if kind == "columnar":
+                self.add_column(field)
+            else:
+                IndexManager.build_index(field, self.data, self.indexes)
+                self.stats.build(field, self.indexes[field])
+            if kind == "ordered":
+                self.ordered_indexes[field] = IndexManager.build_ordered_index(field, self.indexes)
+            self.db.save_meta(self)
+            self.performance.track_operation("INDEX", self.name, start_time)
+            self.logger.info("Created %s index on %s", kind, field)
+
+    def drop_index(self, field: str, user_role: Optional[str] = None):
+        start_time = time.time()
+        if user_role is not None:
+            self.security.restrict_access("select", user_role, self.name)
+        with self.lock.write():
+            if field not in self.indexes:
+                raise ValueError(f"No index on {field}")
+            del self.indexes[field]
+            self.ordered_indexes.pop(field, None)
+            self.stats.drop(field)
+            self.db.save_meta(self)
+            self.performance.track_operation("DROP_INDEX", self.name, start_time)
+            self.logger.info("Dropped index on %s", field)
+
+    def index_advice(self) -> List[Dict]:
+        return self.performance.advisor.advise(len(self.data), set(self.indexes))
+
+    def index_usage(self) -> Dict:
+        return self.performance.advisor.summary()
+
+    def apply_index_advice(self) -> List[Dict]:
+        applied = []
+        for item in self.index_advice():
             try:
-                for op in operations:
-                    op_type = op.get("type")
-                    if op_type == "insert":
-                        tx.insert(op.get("data", {}), user_role)
-                    elif op_type == "update":
-                        tx.update(op.get("conditions", {}), op.get("data", {}), user_role)
-                    elif op_type == "delete":
-                        tx.delete(op.get("conditions", {}), user_role)
-                tx.commit()
-                self.performance.track_operation("TRANSACTION", self.name, start_time)
-                self.logger.info(f"Transaction committed by {user_role}")
-                return True
-            except Exception as e:
-                tx.rollback()
-                self.performance.track_operation("TRANSACTION_FAILED", self.name, start_time)
-                self.logger.error(f"Transaction failed: {e}")
-                return False
+                if item["action"] == "create":
+                    self.create_index(item["field"], item["kind"])
+                else:
+                    self.drop_index(item["field"])
+            except ValueError as e:
+                self.logger.warning("Index advice for %s.%s not applied: %s", self.name, item["field"], e)
+                continue
+            self.performance.advisor.applied(item)
+            applied.append(item)
+            self.logger.info("Index advisor %sd %s on %s: %s", item["action"], item["field"], self.name, item["reason"])
+        return applied
 
-    def create_index(self, field: str):
+    def create_compound_index(self, fields: List[str], include: List[str] = None, user_role: Optional[str] = None):
         start_time = time.time()
-        with self.lock:
-            IndexManager.build_index(field, self.data, self.indexes)
-            self.save_data()
+        if user_role is not None:
+            self.security.restrict_access("select", user_role, self.name)
+        if not fields:
+            raise ValueError("Compound index needs at least one field")
+        with self.lock.write():
+            compound = CompoundIndex(fields, include or [])
+            compound.build(self.data)
+            self.compound_indexes[compound.name] = compound
+            self.db.save_meta(self)
             self.performance.track_operation("INDEX", self.name, start_time)
-            self.logger.info(f"Created index on {field}")
+            self.logger.info("Created compound index on %s including %s", compound.name, list(compound.include))
+
+    def meta(self) -> Dict:
+        return {
+            "schema": self.schema,
+            "sensitive_fields": self.sensitive_fields,
+            "randomized_fields": self.randomized_fields,
+            "index_fields": list(self.indexes),
+            "ordered_index_fields": list(self.ordered_indexes),
+            "columnar_fields": self.columns.fields if self.columns is not None else [],
+            "compound_indexes": [{"fields": list(c.fields), "include": list(c.include)} for c in self.compound_indexes.values()],
+            "checkpoint_lsn": self.checkpoint_lsn,
+            "id_style": self.ids.style,
+            "next_id": self.ids.next_id
+        }
 
     def save_data(self):
         self.db.save_db()
\ No newline at end of file
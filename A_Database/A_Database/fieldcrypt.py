@@ -0,0 +1,128 @@
+import base64
+import hmac
+import json
+import os
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, Optional
+
+# Stored form of a protected value: a mode prefix and url-safe base64 of
+#   deterministic: siv(16) || body     siv = HMAC(mac_key, plaintext)
+#   randomized:    nonce(16) || body || tag(16)
+# where body is the JSON-encoded value XORed with an HMAC-SHA256 keystream.
+# Values without a prefix (plaintext, or SHA-256 digests written by older
+# versions) are not ciphertext and pass through decrypt unchanged.
+DETERMINISTIC = "enc:d:"
+RANDOMIZED = "enc:r:"
+NONCE_SIZE = 16
+TAG_SIZE = 16
+KEY_ENV = "MYDB_FIELD_KEY"
+KEY_FILE_ENV = "MYDB_KEY_FILE"
+DEFAULT_KEY_FILE = "mydb.key"
+
+class FieldCipher(ABC):
+    """Interface for sensitive-field protection.
+
+    ``encrypt`` must return a string. With ``deterministic`` set, equal
+    values must give equal ciphertext so equality filters and hash indexes
+    can run on the stored form; otherwise equal values should differ.
+    ``decrypt`` must return values that are not its ciphertext unchanged.
+    """
+
+    @abstractmethod
+    def encrypt(self, value: Any, deterministic: bool = True) -> str:
+        ...
+
+    @abstractmethod
+    def decrypt(self, value: Any) -> Any:
+        ...
+
+    @staticmethod
+    def is_ciphertext(value: Any) -> bool:
+        return isinstance(value, str) and value.startswith((DETERMINISTIC, RANDOMIZED))
+
+class HmacStreamCipher(FieldCipher):
+    """Authenticated stream cipher built from HMAC-SHA256 (standard library only).
+
+    Deterministic mode is SIV-style: the nonce is a MAC of the plaintext,
+    which doubles as its integrity check. Randomized mode uses a random
+    nonce and an encrypt-then-MAC tag.
+    """
+
+    def __init__(self, key: bytes):
+        if len(key) < 16:
+            raise ValueError("Field encryption key must be at least 16 bytes")
+        self.enc_key = hmac.digest(key, b"mydb field encryption", "sha256")
+        self.mac_key = hmac.digest(key, b"mydb field authentication", "sha256")
+
+    def keystream(self, nonce: bytes, length: int) -> bytes:
+        blocks = [hmac.digest(self.enc_key, nonce + counter.to_bytes(4, "big"), "sha256")
+                  for counter in range((length + 31) // 32)]
+        return b"".join(blocks)[:length]
+
+    def xor(self, nonce: bytes, data: bytes) -> bytes:
+        stream = self.keystream(nonce, len(data))
+        return (int.from_bytes(data, "big") ^ int.from_bytes(stream, "big")).to_bytes(len(data), "big")
+
+    def encrypt(self, value: Any, deterministic: bool = True) -> str:
+        plaintext = json.dumps(value, separators=(",", ":")).encode()
+        if deterministic:
+            nonce = hmac.digest(self.mac_key, plaintext, "sha256")[:NONCE_SIZE]
+            token, prefix = nonce + self.xor(nonce, plaintext), DETERMINISTIC
+        else:
+            nonce = os.urandom(NONCE_SIZE)
+            sealed = nonce + self.xor(nonce, plaintext)
+            token, prefix = sealed + hmac.digest(self.mac_key, sealed, "sha256")[:TAG_SIZE], RANDOMIZED
+        return prefix + base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+    def decrypt(self, value: Any) -> Any:
+        if not self.is_ciphertext(value):
+            return value
+        body = value[len(DETERMINISTIC):]
+        raw = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+        nonce = raw[:NONCE_SIZE]
+        if value.startswith(DETERMINISTIC):
+            plaintext = self.xor(nonce, raw[NONCE_SIZE:])
+            valid = hmac.compare_digest(hmac.digest(self.mac_key, plaintext, "sha256")[:NONCE_SIZE], nonce)
+        else:
+            sealed, tag = raw[:-TAG_SIZE], raw[-TAG_SIZE:]
+            valid = hmac.compare_digest(hmac.digest(self.mac_key, sealed, "sha256")[:TAG_SIZE], tag)
+            plaintext = self.xor(nonce, sealed[NONCE_SIZE:]) if valid else b""
+        if not valid:
+            raise ValueError("Sensitive field failed authentication: wrong key or corrupted value")
+        return json.loads(plaintext)
+
+def load_key(path: Optional[str] = None) -> bytes:
+    """The master key from $MYDB_FIELD_KEY (hex or base64), else a key file.
+
+    A missing key file is created with a random 32-byte key readable only
+    by its owner; keep it with the database, which is unreadable without it.
+    """
+    configured = os.environ.get(KEY_ENV)
+    if configured:
+        try:
+            return bytes.fromhex(configured)
+        except ValueError:
+            return base64.urlsafe_b64decode(configured + "=" * (-len(configured) % 4))
+    path = path or os.environ.get(KEY_FILE_ENV, DEFAULT_KEY_FILE)
+    if not os.path.exists(path):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # another process created it first
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(os.urandom(32).hex())
+    with open(path) as f:
+        return bytes.fromhex(f.read().strip())
+
+_default_cipher: Optional[FieldCipher] = None
+_default_lock = Lock()
+
+def default_cipher() -> FieldCipher:
+    # One key load per process, shared by every collection's Security.
+    global _default_cipher
+    with _default_lock:
+        if _default_cipher is None:
+            _default_cipher = HmacStreamCipher(load_key())
+        return _default_cipher
@@ -1,14 +1,348 @@
-from typing import Dict, List
-from mydb_types import Records, Indexes
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from heapq import heapify, heappop, heappush
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from mydb_types import Records, Record, Indexes
+
+def to_number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+class OrderedIndex:
+    """Sorted array of the distinct numeric values of a hash index.
+
+    Posting lists stay in the hash index; this only maps a numeric range to
+    the raw values whose postings answer it. Non-numeric values are skipped,
+    matching ``Collection.match_query`` which never range-matches them.
+    """
+
+    def __init__(self, values=()):
+        pairs = sorted(((to_number(v), v) for v in values if to_number(v) is not None), key=lambda p: p[0])
+        self.numbers: List[float] = [p[0] for p in pairs]
+        self.values: List[Any] = [p[1] for p in pairs]
+
+    def add_value(self, value: Any):
+        number = to_number(value)
+        if number is None:
+            return
+        pos = bisect_right(self.numbers, number)
+        self.numbers.insert(pos, number)
+        self.values.insert(pos, value)
+
+    def discard_value(self, value: Any):
+        number = to_number(value)
+        if number is None:
+            return
+        for pos in range(bisect_left(self.numbers, number), bisect_right(self.numbers, number)):
+            if self.values[pos] == value:
+                del self.numbers[pos]
+                del self.values[pos]
+                return
+
+    def range(self, ops: Dict[str, Any]) -> List[Any]:
+        lo, hi = 0, len(self.numbers)
+        for op, bound in ops.items():
+            if op == "$gt":
+                lo = max(lo, bisect_right(self.numbers, bound))
+            elif op == "$gte":
+                lo = max(lo, bisect_left(self.numbers, bound))
+            elif op == "$lt":
+                hi = min(hi, bisect_left(self.numbers, bound))
+            elif op == "$lte":
+                hi = min(hi, bisect_right(self.numbers, bound))
+        return self.values[lo:hi] if lo < hi else []
+
+# Compound index entries sort component-wise with numbers first, then other
+# values, then nulls; HIGH sorts after every component.
+HIGH = (3,)
+
+def component_key(value: Any) -> tuple:
+    if value is None:
+        return (2, 0.0, "")
+    number = to_number(value)
+    if number is None or number != number:
+        return (1, 0.0, str(value))
+    return (0, number, "")
+
+class CompoundIndex:
+    """Index over an ordered tuple of fields, optionally covering more.
+
+    Distinct value tuples are kept sorted so equality on a leading prefix,
+    optionally followed by a range on the next field, is one bisect. Each
+    key also maps to the values of ``fields + include`` so queries that only
+    need those fields are answered without touching the records.
+    """
+
+    def __init__(self, fields: List[str], include: List[str] = ()):
+        self.fields = tuple(fields)
+        self.include = tuple(field for field in include if field not in fields)
+        self.columns = self.fields + self.include
+        self.sort_keys: List[tuple] = []
+        self.entries: Dict[tuple, Dict[str, None]] = {}
+        self.covered: Dict[str, tuple] = {}
+
+    @property
+    def name(self) -> str:
+        return ",".join(self.fields)
+
+    def build(self, data: Records):
+        for key, record in data.items():
+            self.add(key, record)
+
+    def covers(self, fields) -> bool:
+        return all(field == "_id" or field in self.columns for field in fields)
+
+    def add(self, key: str, record: Record):
+        if not any(field in record for field in self.fields):
+            return
+        values = tuple(record.get(field) for field in self.fields)
+        sort_key = tuple(component_key(value) for value in values)
+        posting = self.entries.get(sort_key)
+        if posting is None:
+            self.entries[sort_key] = {key: None}
+            insort(self.sort_keys, sort_key)
+        else:
+            posting[key] = None
+        self.covered[key] = tuple(record.get(field) for field in self.columns)
+
+    def add_many(self, keys: List[str], data: Records):
+        # Bulk path: collect entries first, then sort the distinct tuples once.
+        entries, covered, columns = self.entries, self.covered, self.columns
+        for key in keys:
+            record = data[key]
+            if not any(field in record for field in self.fields):
+                continue
+            sort_key = tuple(component_key(record.get(field)) for field in self.fields)
+            entries.setdefault(sort_key, {})[key] = None
+            covered[key] = tuple(record.get(field) for field in columns)
+        self.sort_keys = sorted(entries)
+
+    def remove(self, key: str, record: Record):
+        if self.covered.pop(key, None) is None:
+            return
+        sort_key = tuple(component_key(record.get(field)) for field in self.fields)
+        posting = self.entries.get(sort_key)
+        if posting is None or key not in posting:
+            return
+        del posting[key]
+        if not posting:
+            del self.entries[sort_key]
+            del self.sort_keys[bisect_left(self.sort_keys, sort_key)]
+
+    def update(self, key: str, old_record: Record, new_record: Record):
+        self.remove(key, old_record)
+        self.add(key, new_record)
+
+    def match(self, conditions: Dict) -> Optional[Tuple[List[Any], Dict[str, Any]]]:
+        """Leading equality values and the range on the next field, if usable."""
+        prefix = []
+        for field in self.fields:
+            condition = conditions.get(field)
+            if isinstance(condition, str):
+                prefix.append(condition)
+                continue
+            if isinstance(condition, dict) and any(op in condition for op in IndexManager.RANGE_OPS):
+                return prefix, {op: bound for op, bound in condition.items() if op in IndexManager.RANGE_OPS}
+            break
+        return (prefix, {}) if prefix else None
+
+    def used_fields(self, prefix: List[Any], ops: Dict[str, Any]) -> List[str]:
+        return list(self.fields[:len(prefix) + (1 if ops else 0)])
+
+    def scan(self, prefix: List[Any], ops: Dict[str, Any]) -> List[tuple]:
+        base = tuple(component_key(value) for value in prefix)
+        if not ops:
+            lo = bisect_left(self.sort_keys, base)
+            hi = bisect_left(self.sort_keys, base + (HIGH,))
+            return self.sort_keys[lo:hi]
+        low, high = float("-inf"), float("inf")
+        low_inclusive = high_inclusive = True
+        for op, bound in ops.items():
+            if op in ("$gt", "$gte") and (bound > low or (bound == low and op == "$gt")):
+                low, low_inclusive = bound, op == "$gte"
+            elif op in ("$lt", "$lte") and (bound < high or (bound == high and op == "$lt")):
+                high, high_inclusive = bound, op == "$lte"
+        # Ranges only cover numeric components; appending HIGH skips every
+        # entry equal to the bound itself.
+        low_key = base + ((0, float(low), ""),) + (() if low_inclusive else (HIGH,))
+        high_key = base + ((0, float(high), ""),) + ((HIGH,) if high_inclusive else ())
+        lo = bisect_left(self.sort_keys, low_key)
+        hi = bisect_left(self.sort_keys, high_key)
+        return self.sort_keys[lo:hi] if lo < hi else []
+
+    def count(self, prefix: List[Any], ops: Dict[str, Any]) -> int:
+        entries = self.entries
+        return sum(len(entries[sort_key]) for sort_key in self.scan(prefix, ops))
+
+    def lookup(self, prefix: List[Any], ops: Dict[str, Any]) -> List[str]:
+        keys = []
+        for sort_key in self.scan(prefix, ops):
+            keys.extend(self.entries[sort_key])
+        return keys
+
+    def rows(self, keys: List[str]) -> Iterator[Record]:
+        columns, covered = self.columns, self.covered
+        for key in keys:
+            values = covered.get(key)
+            if values is None:
+                continue
+            row = {"_id": key}
+            row.update((field, value) for field, value in zip(columns, values) if value is not None)
+            yield row
+
+class ExpiryIndex:
+    """Epoch expiry time of every record with a ``ttl``, plus a min-heap.
+
+    ``created_at`` and ``ttl`` are parsed once when a record is written, so
+    checking expiry is a dict lookup. Heap entries are invalidated lazily:
+    a popped entry only counts if it still matches ``expires``.
+    """
+
+    def __init__(self):
+        self.expires: Dict[str, float] = {}
+        self.heap: List[Tuple[float, str]] = []
+
+    @staticmethod
+    def expiry_time(record: Record) -> Optional[float]:
+        if "ttl" not in record or "created_at" not in record:
+            return None
+        try:
+            return datetime.fromisoformat(record["created_at"]).timestamp() + float(record["ttl"])
+        except (ValueError, TypeError):
+            return None
+
+    def set(self, key: str, record: Record):
+        expires = self.expiry_time(record)
+        if expires is None:
+            self.expires.pop(key, None)
+            return
+        if self.expires.get(key) != expires:
+            self.expires[key] = expires
+            heappush(self.heap, (expires, key))
+        # Updates leave stale heap entries behind; rebuild before they dominate.
+        if len(self.heap) > 2 * len(self.expires) + 1024:
+            self.heap = [(expires, key) for key, expires in self.expires.items()]
+            heapify(self.heap)
+
+    def discard(self, key: str):
+        self.expires.pop(key, None)
+
+    def is_expired(self, key: str, now: float) -> bool:
+        expires = self.expires.get(key)
+        return expires is not None and expires <= now
+
+    def next_expiry(self) -> Optional[float]:
+        try:
+            return self.heap[0][0]
+        except IndexError:
+            return None
+
+    def due(self, now: float, limit: int) -> List[str]:
+        """Pop up to ``limit`` keys whose expiry time has passed."""
+        keys = []
+        heap, expires = self.heap, self.expires
+        while heap and len(keys) < limit and heap[0][0] <= now:
+            expiry, key = heappop(heap)
+            if expires.get(key) == expiry:
+                keys.append(key)
+        return keys
 
 class IndexManager:
+    """Hash indexes: field -> value -> posting.
+
+    A posting is a dict of record keys mapped to None, an ordered set: keys
+    stay in insertion order for scans and removing one is a single pop.
+    """
+    RANGE_OPS = ("$gt", "$gte", "$lt", "$lte")
+
     @staticmethod
-    def build_index(field: str, data: Records, indexes: Indexes):
+    def build_index(field: str, data: Records, indexes: Indexes, ordered: Dict[str, OrderedIndex] = None):
         index = {}
         for id_, record in data.items():
             if field in record:
                 value = record[field]
                 if value not in index:
-                    index[value] = []
-                index[value].append(id_)
-        indexes[field] = index
\ No newline at end of file
+                    index[value] = {}
+                index[value][id_] = None
+        indexes[field] = index
+        if ordered is not None and field in ordered:
+            ordered[field] = OrderedIndex(index)
+
+    @staticmethod
+    def add_many(keys: List[str], data: Records, indexes: Indexes, ordered: Dict[str, OrderedIndex] = None):
+        # Appends postings for new keys, then re-sorts each ordered index once
+        # instead of inserting value by value.
+        for field, index in indexes.items():
+            for key in keys:
+                record = data[key]
+                if field in record:
+                    posting = index.get(record[field])
+                    if posting is None:
+                        index[record[field]] = {key: None}
+                    else:
+                        posting[key] = None
+        if ordered:
+            for field in ordered:
+                ordered[field] = OrderedIndex(indexes.get(field, {}))
+
+    @staticmethod
+    def build_ordered_index(field: str, indexes: Indexes) -> OrderedIndex:
+        return OrderedIndex(indexes.get(field, {}))
+
+    @staticmethod
+    def add(key: str, record: Record, indexes: Indexes, ordered: Dict[str, OrderedIndex] = None):
+        for field, index in indexes.items():
+            if field in record:
+                IndexManager._insert(index, record[field], key, ordered.get(field) if ordered else None)
+
+    @staticmethod
+    def update(key: str, old_record: Record, new_record: Record, indexes: Indexes, ordered: Dict[str, OrderedIndex] = None):
+        for field, index in indexes.items():
+            old_value = old_record.get(field)
+            new_value = new_record.get(field)
+            if field in old_record and field in new_record and old_value == new_value:
+                continue
+            ordered_index = ordered.get(field) if ordered else None
+            if field in old_record:
+                IndexManager._discard(index, old_value, key, ordered_index)
+            if field in new_record:
+                IndexManager._insert(index, new_value, key, ordered_index)
+
+    @staticmethod
+    def lookup(index: Dict, values: List[Any]) -> List[str]:
+        keys = []
+        for value in dict.fromkeys(values):
+            keys.extend(index.get(value, ()))
+        return keys
+
+    @staticmethod
+    def remove_many(keys: List[str], records: Records, indexes: Indexes, ordered: Dict[str, OrderedIndex] = None):
+        for field, index in indexes.items():
+            ordered_index = ordered.get(field) if ordered else None
+            for key in keys:
+                record = records.get(key)
+                if record is not None and field in record:
+                    IndexManager._discard(index, record[field], key, ordered_index)
+
+    @staticmethod
+    def _insert(index: Dict, value, key: str, ordered_index: Optional[OrderedIndex]):
+        posting = index.get(value)
+        if posting is None:
+            index[value] = {key: None}
+            if ordered_index is not None:
+                ordered_index.add_value(value)
+        else:
+            posting[key] = None
+
+    @staticmethod
+    def _discard(index: Dict, value, key: str, ordered_index: Optional[OrderedIndex]):
+        posting = index.get(value)
+        if posting is None or key not in posting:
+            return
+        del posting[key]
+        if not posting:
+            del index[value]
+            if ordered_index is not None:
+                ordered_index.discard_value(value)
@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+from typing import Dict, Optional
+
+class ReadWriteLock:
+    """Writer-preferring reader/writer lock.
+
+    Both sides are reentrant per thread, and the thread holding the write
+    lock may also take the read lock (explain -> query, transaction -> insert).
+    Upgrading a held read lock to a write lock is refused because two
+    upgrading readers would deadlock each other.
+    """
+
+    def __init__(self):
+        self.cond = Condition(Lock())
+        self.readers: Dict[int, int] = {}
+        self.writer: Optional[int] = None
+        self.write_count = 0
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        me = get_ident()
+        with self.cond:
+            if self.writer == me or me in self.readers:
+                self.readers[me] = self.readers.get(me, 0) + 1
+                return
+            while self.writer is not None or self.waiting_writers:
+                self.cond.wait()
+            self.readers[me] = 1
+
+    def release_read(self):
+        me = get_ident()
+        with self.cond:
+            count = self.readers[me] - 1
+            if count:
+                self.readers[me] = count
+            else:
+                del self.readers[me]
+                self.cond.notify_all()
+
+    def acquire_write(self, blocking: bool = True) -> bool:
+        me = get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.write_count += 1
+                return True
+            if me in self.readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            if not blocking:
+                if self.writer is not None or self.readers:
+                    return False
+            else:
+                self.waiting_writers += 1
+                try:
+                    while self.writer is not None or self.readers:
+                        self.cond.wait()
+                finally:
+                    self.waiting_writers -= 1
+            self.writer = me
+            self.write_count = 1
+            return True
+
+    def release_write(self):
+        with self.cond:
+            self.write_count -= 1
+            if self.write_count == 0:
+                self.writer = None
+                self.cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -1,48 +1,217 @@
+import atexit
+import json
 import logging
 import os
+from collections import deque
 from datetime import datetime
-from typing import List
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from threading import Event, Lock
+from typing import Dict, List, Optional
 
-class Logger:
-    def __init__(self, name: str, log_file: str = "app.log"):
-        self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
+# Log files get one JSON object per line; the console keeps the readable
+# format. Everything is written by one background thread, so a call on the
+# hot path costs a level check, a LogRecord and a queue put.
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_LEVEL_ENV = "MYDB_LOG_LEVEL"          # file threshold, INFO by default
+CONSOLE_LEVEL_ENV = "MYDB_CONSOLE_LEVEL"  # console threshold, WARNING by default
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+def level_from_env(variable: str, default: int) -> int:
+    level = logging.getLevelName(os.environ.get(variable, "").upper())
+    return level if isinstance(level, int) else default
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="microseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class BufferedFileHandler(RotatingFileHandler):
+    """Rotating file handler that leaves flushing to the writer thread.
+
+    FileHandler flushes after every record; the writer flushes once it has
+    drained the queue, so a burst of records costs one write call. The
+    file size is tracked here rather than formatting each record twice and
+    asking the file system, as RotatingFileHandler.shouldRollover does.
+    """
+
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self.size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record) + self.terminator
+            if self.maxBytes and self.size and self.size + len(line) > self.maxBytes:
+                self.doRollover()
+                self.size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(line)
+            self.size += len(line)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def flush_buffer(self):
+        super().flush()
+
+    def close(self):
+        self.flush_buffer()
+        super().close()
+
+class FlushRequest:
+    def __init__(self):
+        self.done = Event()
+
+class LogWriter(QueueListener):
+    """The one background thread that formats and writes records for every log file.
+
+    It blocks on the queue and flushes only once the queue is empty, so a
+    burst of records is written with one flush per file.
+    """
+
+    def __init__(self, queue: SimpleQueue, console: logging.Handler):
+        super().__init__(queue, console, respect_handler_level=True)
+        self.console = console
+        self.files: Dict[str, BufferedFileHandler] = {}
+
+    def handle(self, record):
+        if isinstance(record, FlushRequest):
+            self.flush()
+            record.done.set()
+            return
+        handler = self.files.get(record.log_file)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+        if self.queue.empty():
+            self.flush()
+
+    def flush(self):
+        for handler in list(self.files.values()):
+            handler.flush_buffer()
+
+    def close(self):
+        for handler in list(self.files.values()):
+            handler.close()
+
+class DeferredQueueHandler(QueueHandler):
+    """Puts records for one log file on the writer's queue, unformatted.
+
+    QueueHandler.prepare formats the message in the caller's thread; here
+    the writer does it. Arguments are therefore read when the record is
+    written, so pass values rather than objects that are about to change.
+    """
+
+    def __init__(self, queue: SimpleQueue, log_file: str):
+        super().__init__(queue)
         self.log_file = log_file
 
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.log_file = self.log_file
+        return record
+
+_handlers: Dict[str, QueueHandler] = {}
+_writer: Optional[LogWriter] = None
+_handlers_lock = Lock()
 
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
+def queue_handler(log_file: str) -> QueueHandler:
+    """The shared handler for ``log_file``; the writer thread starts on first use."""
+    global _writer
+    with _handlers_lock:
+        handler = _handlers.get(log_file)
+        if handler is None:
+            if _writer is None:
+                console = logging.StreamHandler()
+                console.setLevel(level_from_env(CONSOLE_LEVEL_ENV, logging.WARNING))
+                console.setFormatter(logging.Formatter(TEXT_FORMAT))
+                _writer = LogWriter(SimpleQueue(), console)
+                _writer.start()
+            file_handler = BufferedFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+            file_handler.setLevel(level_from_env(LOG_LEVEL_ENV, logging.INFO))
+            file_handler.setFormatter(JsonLinesFormatter())
+            _writer.files[log_file] = file_handler
+            handler = _handlers[log_file] = DeferredQueueHandler(_writer.queue, log_file)
+        return handler
 
-        stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(logging.INFO)
-        stream_handler.setFormatter(formatter)
+def flush_logs():
+    """Wait until every record logged so far has been written."""
+    writer = _writer
+    if writer is not None:
+        request = FlushRequest()
+        writer.queue.put(request)
+        request.done.wait()
 
+@atexit.register
+def shutdown_logging():
+    global _writer
+    with _handlers_lock:
+        if _writer is not None:
+            _writer.stop()  # writes what is still queued
+            _writer.close()
+            _writer = None
+        _handlers.clear()
+
+class Logger:
+    def __init__(self, name: str, log_file: str = "app.log"):
+        self.logger = logging.getLogger(name)
+        self.log_file = log_file
         if not self.logger.handlers:
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(stream_handler)
+            # Records below both thresholds are dropped before a LogRecord is built.
+            self.logger.setLevel(min(level_from_env(LOG_LEVEL_ENV, logging.INFO),
+                                     level_from_env(CONSOLE_LEVEL_ENV, logging.WARNING)))
+            self.logger.addHandler(queue_handler(log_file))
+
+    # Messages take %-style arguments, formatted only if the record is kept
+    # and then by the writer thread. Keyword arguments become the record's
+    # structured "fields" in the JSON log.
+    def log(self, level: int, message: str, args: tuple, fields: Dict):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, *args, extra={"fields": fields} if fields else None)
 
-    def debug(self, message: str):
-        self.logger.debug(message)
+    def debug(self, message: str, *args, **fields):
+        self.log(logging.DEBUG, message, args, fields)
 
-    def info(self, message: str):
-        self.logger.info(message)
+    def info(self, message: str, *args, **fields):
+        self.log(logging.INFO, message, args, fields)
 
-    def warning(self, message: str):
-        self.logger.warning(message)
+    def warning(self, message: str, *args, **fields):
+        self.log(logging.WARNING, message, args, fields)
 
-    def error(self, message: str):
-        self.logger.error(message)
+    def error(self, message: str, *args, **fields):
+        self.log(logging.ERROR, message, args, fields)
 
-    def critical(self, message: str):
-        self.logger.critical(message)
+    def critical(self, message: str, *args, **fields):
+        self.log(logging.CRITICAL, message, args, fields)
 
     def get_recent_logs(self, limit: int = 10) -> List[str]:
-        logs = []
+        flush_logs()
         try:
             with open(self.log_file, 'r') as f:
-                logs = f.readlines()
-            return logs[-limit:]
+                lines = deque(f, maxlen=limit)
         except FileNotFoundError:
-            return []
\ No newline at end of file
+            return []
+        logs = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                logs.append(f"{entry['time']} - {entry['logger']} - {entry['level']} - {entry['message']}\n")
+            except (ValueError, KeyError, TypeError):
+                logs.append(line)  # written before the JSON format
+        return logs
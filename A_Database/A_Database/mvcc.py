@@ -0,0 +1,225 @@
+from collections import Counter
+from contextlib import contextmanager
+from itertools import chain, islice
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional
+from mydb_types import Record, Records
+
+class Version:
+    """One committed state of a record: visible to snapshots taken at or after
+    ``begin`` until the next version's begin. ``record`` is None for a delete."""
+    __slots__ = ("record", "begin", "prev")
+
+    def __init__(self, record: Optional[Record], begin: int, prev: Optional["Version"]):
+        self.record = record
+        self.begin = begin
+        self.prev = prev
+
+class Snapshot:
+    """A consistent read view of a collection at commit timestamp ``ts``.
+
+    Taking one is O(1): it remembers the clock and the length of the
+    append-only key list, not the data. Release it when done so its
+    versions can be collected.
+    """
+    CHUNK = 1024
+
+    def __init__(self, store: "VersionStore", ts: int, keys: List[str], count: int):
+        self.store = store
+        self.ts = ts
+        self.all_keys = keys
+        self.count = count
+        self.released = False
+
+    def source(self, keys: Optional[List[str]]) -> Iterable[Record]:
+        """Records of this snapshot for a plan's candidate keys (None = full scan).
+
+        Indexes describe the latest state, so keys written since the snapshot
+        are added to the candidates and each one is read at the snapshot's
+        version. The caller holds the collection read lock; the returned
+        records can be consumed after it is released.
+        """
+        changed = self.store.changed_since(self.ts)
+        if keys is None:
+            if not changed:
+                # Nothing written since the snapshot: the live values are its
+                # state, and copying the value pointers beats keyed reads.
+                return list(self.store.data.values())
+            return self.records(list(islice(self.all_keys, self.count)))
+        if changed:
+            seen = set(keys)
+            keys = list(keys) + [key for key in changed if key not in seen]
+        return self.records(keys)
+
+    def records(self, keys: List[str]) -> Iterator[Record]:
+        chunks = (keys[i:i + self.CHUNK] for i in range(0, len(keys), self.CHUNK))
+        return chain.from_iterable(map(self.read_chunk, chunks))
+
+    def read_chunk(self, keys: List[str]) -> List[Record]:
+        # Records are read from data before their versions are looked up:
+        # writers install the version first, so a changed record is never
+        # mistaken for an unversioned one.
+        records = list(map(self.store.data.get, keys))
+        versions = self.store.versions
+        # An empty version map after the reads means none of them has changed.
+        versions = list(map(versions.get, keys)) if versions else ()
+        if any(versions):
+            ts = self.ts
+            for i, version in enumerate(versions):
+                if version is not None:
+                    while version is not None and version.begin > ts:
+                        version = version.prev
+                    records[i] = version.record if version is not None else None
+        return [record for record in records if record is not None]
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.store.release(self.ts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class VersionStore:
+    """Multi-version bookkeeping for one collection.
+
+    ``data`` stays the latest committed state that indexes and storage use.
+    A write installs a Version (begin = clock + 1) before changing ``data``,
+    and the clock moves to that timestamp once the outermost write finishes,
+    so a transaction becomes visible to new snapshots all at once. Keys
+    untouched since the oldest live snapshot carry no versions and are read
+    straight from ``data``. All mutating methods run under the collection's
+    write lock.
+    """
+
+    def __init__(self, data: Records, collect_threshold: int = 1024):
+        self.data = data
+        self.versions: Dict[str, Version] = {}
+        self.keys: List[str] = list(data)
+        self.clock = 0
+        self.depth = 0
+        self.pending: List[str] = []
+        self.dead_keys = 0
+        self.pending_base = (0, 0)  # len(keys) and dead_keys before the pending write
+        self.collect_threshold = collect_threshold
+        self.next_collect = collect_threshold
+        self.active: Counter = Counter()
+        self.lock = Lock()
+
+    def snapshot(self) -> Snapshot:
+        with self.lock:
+            ts = self.clock
+            self.active[ts] += 1
+            return Snapshot(self, ts, self.keys, len(self.keys))
+
+    def release(self, ts: int):
+        with self.lock:
+            self.active[ts] -= 1
+            if not self.active[ts]:
+                del self.active[ts]
+
+    def oldest(self) -> int:
+        with self.lock:
+            return min(self.active, default=self.clock)
+
+    @contextmanager
+    def write(self):
+        # Nested writes (transaction -> insert) commit with the outermost one.
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.publish()
+
+    def install(self, key: str, old: Optional[Record], new: Optional[Record]):
+        """Record a change of ``key`` from ``old`` to ``new`` before ``data`` changes."""
+        ts = self.clock + 1
+        prev = self.versions.get(key)
+        if prev is None and old is not None:
+            prev = Version(old, 0, None)
+        self.versions[key] = Version(new, ts, prev)
+        if not self.pending:
+            self.pending_base = (len(self.keys), self.dead_keys)
+        self.pending.append(key)
+        if old is None:
+            self.keys.append(key)
+        elif new is None:
+            self.dead_keys += 1
+        if not self.depth:
+            self.publish()
+
+    def install_many(self, records: Records):
+        ts = self.clock + 1
+        versions = self.versions
+        for key, record in records.items():
+            versions[key] = Version(record, ts, None)
+        if not self.pending:
+            self.pending_base = (len(self.keys), self.dead_keys)
+        self.keys.extend(records)
+        self.pending.extend(records)
+        if not self.depth:
+            self.publish()
+
+    def publish(self):
+        if not self.pending:
+            return
+        self.pending = []
+        self.clock += 1
+        # With no snapshot open nothing needs the old versions: dropping them
+        # now keeps scans on the unversioned fast path.
+        if not self.active or len(self.versions) >= self.next_collect:
+            self.collect()
+
+    def abort(self):
+        """Drop the versions of an unpublished write that is being rolled back."""
+        ts = self.clock + 1
+        for key in reversed(self.pending):
+            version = self.versions.get(key)
+            while version is not None and version.begin == ts:
+                version = version.prev
+            if version is None:
+                self.versions.pop(key, None)
+            else:
+                self.versions[key] = version
+        # Undoing a delete re-installs a key that is still listed, so put the
+        # key list back as it was rather than trusting the undo's installs.
+        if self.pending:
+            count, self.dead_keys = self.pending_base
+            if count < len(self.keys):
+                self.keys = self.keys[:count]
+        self.pending = []
+        if not self.active:
+            self.collect()
+
+    def changed_since(self, ts: int) -> List[str]:
+        return [key for key, version in self.versions.items() if version.begin > ts]
+
+    def collect(self) -> int:
+        """Drop versions no live snapshot can see; returns how many keys were freed."""
+        oldest = self.oldest()
+        freed = 0
+        for key, head in list(self.versions.items()):
+            version = head
+            while version is not None and version.begin > oldest:
+                version = version.prev
+            if version is head and head.begin <= self.clock:
+                # Every snapshot sees the latest state, which data already holds.
+                del self.versions[key]
+                freed += 1
+            elif version is not None:
+                version.prev = None
+        if self.dead_keys * 2 > len(self.keys):
+            # Replace rather than edit the list: open snapshots keep iterating the old one.
+            self.keys = [key for key in self.keys if key in self.data or key in self.versions]
+            self.dead_keys = 0
+        self.next_collect = max(self.collect_threshold, 2 * len(self.versions))
+        return freed
+
+    def summary(self) -> Dict:
+        with self.lock:
+            return {"clock": self.clock, "versioned_keys": len(self.versions), "snapshots": sum(self.active.values())}
@@ -1,15 +1,105 @@
-from typing import Dict, Any
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
+import sys
 import time
 from logger import Logger
+from advisor import IndexAdvisor
+
+def estimate_size(results: Any) -> int:
+    if not isinstance(results, list):
+        return sys.getsizeof(results)
+    size = sys.getsizeof(results)
+    for row in results:
+        size += sys.getsizeof(row)
+        if isinstance(row, dict):
+            for key, value in row.items():
+                size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+class QueryCache:
+    """LRU result cache bounded by entry count, estimated bytes and age.
+
+    Entries are keyed by (collection, version, query). Writes bump the
+    collection's version and drop its entries, and results computed against
+    an older version are never stored.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, int, str], Tuple[Any, int, float]]" = OrderedDict()
+        self.versions: Dict[str, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = Lock()
+
+    def version(self, collection_name: str) -> int:
+        return self.versions.get(collection_name, 0)
+
+    def get(self, collection_name: str, query_str: str) -> Optional[List]:
+        key = (collection_name, self.version(collection_name), query_str)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] < time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0]) if isinstance(entry[0], list) else entry[0]
+
+    def put(self, collection_name: str, query_str: str, results: Any, version: int):
+        size = estimate_size(results)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if version != self.version(collection_name):
+                return
+            key = (collection_name, version, query_str)
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (results, size, time.time() + self.ttl)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, collection_name: str):
+        with self.lock:
+            self.versions[collection_name] = self.version(collection_name) + 1
+            for key in [k for k in self.entries if k[0] == collection_name]:
+                self._drop(key)
+            self.invalidations += 1
+
+    def _drop(self, key: Tuple[str, int, str]):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups > 0 else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "bytes": self.bytes
+        }
 
 class Performance:
-    def __init__(self):
+    def __init__(self, cache: Optional[QueryCache] = None):
         self.logger = Logger("Performance", log_file="performance.log")
-        self.cache = {}
-        self.cache_hits = 0
-        self.cache_misses = 0
+        self.cache = cache if cache is not None else QueryCache()
         self.metrics = {}
-        self.auto_index_fields = set()
+        self.lock = Lock()
+        self.advisor = IndexAdvisor()
         self.is_monitoring = False
 
     def start_monitoring(self):
@@ -20,44 +110,46 @@ class Performance:
         if not self.is_monitoring:
             return
         elapsed = time.time() - start_time
-        if collection_name not in self.metrics:
-            self.metrics[collection_name] = {}
-        if operation not in self.metrics[collection_name]:
-            self.metrics[collection_name][operation] = {"count": 0, "total_time": 0.0}
-        self.metrics[collection_name][operation]["count"] += 1
-        self.metrics[collection_name][operation]["total_time"] += elapsed
-        self.logger.info(f"Tracked {operation} on {collection_name}: {elapsed:.3f}s")
-
-    def cache_query(self, query_str: str, results: Any):
+        with self.lock:
+            if collection_name not in self.metrics:
+                self.metrics[collection_name] = {}
+            if operation not in self.metrics[collection_name]:
+                self.metrics[collection_name][operation] = {"count": 0, "total_time": 0.0}
+            self.metrics[collection_name][operation]["count"] += 1
+            self.metrics[collection_name][operation]["total_time"] += elapsed
+        self.logger.info("Tracked %s on %s: %.3fs", operation, collection_name, elapsed)
+
+    def cache_version(self, collection_name: str) -> int:
+        return self.cache.version(collection_name)
+
+    def cache_query(self, collection_name: str, query_str: str, results: Any, version: int):
         if not self.is_monitoring:
             return
-        self.cache[query_str] = results
-        self.logger.debug(f"Cached query: {query_str}")
+        self.cache.put(collection_name, query_str, results, version)
+        self.logger.debug("Cached query: %s", query_str)
 
-    def get_cached_query(self, query_str: str) -> Any:
+    def get_cached_query(self, collection_name: str, query_str: str) -> Any:
         if not self.is_monitoring:
             return None
-        if query_str in self.cache:
-            self.cache_hits += 1
-            self.logger.debug(f"Cache hit for query: {query_str}")
-            return self.cache[query_str]
-        self.cache_misses += 1
-        self.logger.debug(f"Cache miss for query: {query_str}")
-        return None
-
-    def suggest_index(self, collection_name: str, field: str):
-        if not self.is_monitoring:
+        results = self.cache.get(collection_name, query_str)
+        if results is not None:
+            self.logger.debug("Cache hit for query: %s", query_str)
+        else:
+            self.logger.debug("Cache miss for query: %s", query_str)
+        return results
+
+    def invalidate_cache(self, collection_name: str):
+        self.cache.invalidate(collection_name)
+
+    def record_filter(self, collection_name: str, conditions: Dict, plan: Dict, rows: int):
+        if not self.is_monitoring or not conditions:
             return
-        self.auto_index_fields.add((collection_name, field))
-        self.logger.info(f"Suggested index on {collection_name}.{field}")
+        self.advisor.record(conditions, plan, rows)
+        self.logger.debug("Recorded filter on %s: %s via %s", collection_name, list(conditions), plan.get("method"))
 
     def get_metrics(self) -> Dict:
         return {
-            "cache_stats": {
-                "hits": self.cache_hits,
-                "misses": self.cache_misses,
-                "hit_ratio": self.cache_hits / (self.cache_hits + self.cache_misses) if (self.cache_hits + self.cache_misses) > 0 else 0
-            },
-            "index_hints": list(self.auto_index_fields),
+            "cache_stats": self.cache.stats(),
+            "index_hints": self.advisor.summary(),
             "metrics_summary": self.metrics
         }
\ No newline at end of file
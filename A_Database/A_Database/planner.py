@@ -0,0 +1,234 @@
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from mydb_types import Conditions, ExplainPlan
+from index import IndexManager
+
+# Relative costs: evaluating the predicate on a fetched row, producing or
+# probing one key of an index, and masking one row of a numeric column.
+ROW_COST = 1.0
+KEY_COST = 0.25
+COLUMN_COST = 0.05
+# Fallback selectivities for conditions without statistics.
+EQ_SELECTIVITY = 0.1
+RANGE_SELECTIVITY = 1 / 3
+
+class AccessPath(NamedTuple):
+    method: str
+    field: str
+    estimate: float
+    cost: float
+    keys: Callable[[], List[str]]
+    children: Tuple["AccessPath", ...] = ()
+
+class Planner:
+    """Cost-based access path selection for one collection.
+
+    Each AND branch considers a full scan, every usable single index or
+    column scan, and intersections of the most selective indexes. OR
+    filters (disjuncts) union the best plan of every branch unless one of
+    them needs a full scan anyway.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def plan(self, conditions: Conditions, disjuncts: List[Conditions] = None,
+             needed: List[str] = None) -> Tuple[Optional[List[str]], ExplainPlan]:
+        """Candidate keys (None for a full scan) and the plan that produced them.
+
+        ``needed`` lists the fields the query reads besides its filter; when a
+        compound index covers them the plan is ``index_only``.
+        """
+        rows = len(self.collection.data)
+        if not disjuncts:
+            path = self.best_path(conditions, rows, needed)
+            estimate = self.estimate(conditions, rows)
+            if path is None:
+                return None, self.scan_plan(rows, estimate)
+            # Matching rows are a subset of the candidates the path reads.
+            return path.keys(), self.describe(path, min(estimate, path.estimate))
+        paths = []
+        estimate = min(rows, sum(self.estimate(branch, rows) for branch in disjuncts))
+        for branch in disjuncts:
+            path = self.best_path(branch, rows)
+            if path is None:
+                return None, self.scan_plan(rows, estimate)
+            paths.append(path)
+        cost = sum(path.cost for path in paths)
+        if cost >= rows * ROW_COST:
+            return None, self.scan_plan(rows, estimate)
+        keys = list(dict.fromkeys(key for path in paths for key in path.keys()))
+        plan = {
+            "method": "index_union",
+            "field": ",".join(dict.fromkeys(path.field for path in paths)),
+            "estimated_rows": round(estimate),
+            "cost": round(cost, 1),
+            "children": [self.describe(path) for path in paths]
+        }
+        return keys, plan
+
+    def estimate(self, conditions: Conditions, rows: int) -> float:
+        """Estimated rows matching a conjunction, assuming independent fields."""
+        if not rows:
+            return 0.0
+        indexes, stats = self.collection.indexes, self.collection.stats
+        selectivity = 1.0
+        for field, condition in conditions.items():
+            index = indexes.get(field)
+            if isinstance(condition, str):
+                selectivity *= len(index.get(condition, ())) / rows if index is not None else EQ_SELECTIVITY
+                continue
+            if not isinstance(condition, dict):
+                continue
+            if "$in" in condition:
+                values = list(dict.fromkeys(condition["$in"]))
+                if index is not None:
+                    selectivity *= min(1.0, sum(len(index.get(value, ())) for value in values) / rows)
+                else:
+                    selectivity *= min(1.0, EQ_SELECTIVITY * len(values))
+            if any(op in condition for op in IndexManager.RANGE_OPS):
+                if field in stats.histograms:
+                    selectivity *= min(1.0, stats.estimate_range(field, condition, rows) / rows)
+                else:
+                    selectivity *= RANGE_SELECTIVITY
+            if "$ne" in condition:
+                selectivity *= 1 - EQ_SELECTIVITY
+        return rows * selectivity
+
+    def best_path(self, conditions: Conditions, rows: int, needed: List[str] = None) -> Optional[AccessPath]:
+        """Cheapest index-based path for a conjunction, or None for a full scan."""
+        paths = sorted(self.access_paths(conditions, rows, needed), key=lambda path: path.estimate)
+        best, best_cost = None, rows * ROW_COST
+        for path in paths:
+            if path.cost < best_cost:
+                best, best_cost = path, path.cost
+        # Intersecting the k most selective paths pays for every key they
+        # produce but only fetches rows that survive all of them. Paths over
+        # fields an earlier path already covers add nothing.
+        distinct, seen = [], set()
+        for path in paths:
+            fields = set(path.field.split(","))
+            if not fields & seen:
+                distinct.append(path)
+                seen |= fields
+        for k in range(2, len(distinct) + 1):
+            chosen = distinct[:k]
+            selectivity = 1.0
+            for path in chosen:
+                selectivity *= path.estimate / rows if rows else 0.0
+            estimate = rows * selectivity
+            cost = sum(path.estimate for path in chosen) * KEY_COST + estimate * ROW_COST
+            if cost < best_cost:
+                best, best_cost = self.intersection(chosen, estimate, cost), cost
+        return best
+
+    def access_paths(self, conditions: Conditions, rows: int, needed: List[str] = None) -> List[AccessPath]:
+        collection = self.collection
+        indexes, ordered, stats = collection.indexes, collection.ordered_indexes, collection.stats
+        paths = []
+        for field, condition in conditions.items():
+            index = indexes.get(field)
+            if field == "_id" and index is None:
+                paths.extend(self.id_paths(condition, rows))
+                continue
+            if index is None:
+                continue
+            if isinstance(condition, str):
+                values = [condition]
+                method = "index"
+            elif isinstance(condition, dict) and "$in" in condition:
+                values = list(dict.fromkeys(condition["$in"]))
+                method = "index_in"
+            elif isinstance(condition, dict) and field in ordered and any(op in condition for op in IndexManager.RANGE_OPS):
+                estimate = min(rows, stats.estimate_range(field, condition, rows))
+                paths.append(AccessPath("index_range", field, estimate, estimate * (KEY_COST + ROW_COST),
+                                        self.range_keys(field, condition)))
+                continue
+            else:
+                continue
+            # Posting list lengths give exact counts for equality lookups.
+            estimate = sum(len(index.get(value, ())) for value in values)
+            paths.append(AccessPath(method, field, estimate, estimate * (KEY_COST + ROW_COST) + len(values) * KEY_COST,
+                                    self.lookup_keys(field, values)))
+        for name, compound in collection.compound_indexes.items():
+            match = compound.match(conditions)
+            if match is None:
+                continue
+            prefix, ops = match
+            # Entry counts are exact; covered rows skip the record fetch.
+            estimate = compound.count(prefix, ops)
+            keys = self.compound_keys(compound, prefix, ops)
+            if needed is not None and compound.covers(list(needed) + list(conditions)):
+                paths.append(AccessPath("index_only", name, estimate, estimate * 2 * KEY_COST + KEY_COST, keys))
+            else:
+                paths.append(AccessPath("index_compound", name, estimate, estimate * (KEY_COST + ROW_COST) + KEY_COST, keys))
+        columns = collection.columns
+        columnar = columns.usable(conditions) if columns is not None else []
+        if columnar:
+            selectivity = 1.0
+            for field in columnar:
+                if rows:
+                    selectivity *= min(1.0, stats.estimate_range(field, conditions[field], rows) / rows)
+            estimate = rows * selectivity
+            paths.append(AccessPath("columnar_scan", ",".join(columnar), estimate,
+                                    rows * COLUMN_COST + estimate * ROW_COST,
+                                    lambda: columns.filter(conditions)))
+        return paths
+
+    def id_paths(self, condition, rows: int) -> List[AccessPath]:
+        # Records are keyed by _id, so equality is a dict probe and a range
+        # walks the allocated id range instead of the whole collection.
+        collection = self.collection
+        data, ids = collection.data, collection.ids
+        if isinstance(condition, str):
+            values = [condition]
+        elif isinstance(condition, dict) and "$in" in condition:
+            values = list(dict.fromkeys(condition["$in"]))
+        elif isinstance(condition, dict) and any(op in condition for op in IndexManager.RANGE_OPS):
+            numbers = ids.key_range(condition)
+            estimate = min(len(numbers), rows)
+            keys = lambda: [key for key in map(ids.format, numbers) if key in data]
+            return [AccessPath("id_range", "_id", estimate, len(numbers) * KEY_COST + estimate * ROW_COST, keys)]
+        else:
+            return []
+        estimate = sum(1 for value in values if value in data)
+        keys = lambda: [value for value in values if value in data]
+        return [AccessPath("primary_key", "_id", estimate, len(values) * KEY_COST + estimate * ROW_COST, keys)]
+
+    def lookup_keys(self, field: str, values: List) -> Callable[[], List[str]]:
+        index = self.collection.indexes[field]
+        return lambda: IndexManager.lookup(index, values)
+
+    @staticmethod
+    def compound_keys(compound, prefix: List, ops: dict) -> Callable[[], List[str]]:
+        return lambda: compound.lookup(prefix, ops)
+
+    def range_keys(self, field: str, condition: dict) -> Callable[[], List[str]]:
+        index, ordered = self.collection.indexes[field], self.collection.ordered_indexes[field]
+        return lambda: IndexManager.lookup(index, ordered.range(condition))
+
+    @staticmethod
+    def intersection(paths: List[AccessPath], estimate: float, cost: float) -> AccessPath:
+        def keys() -> List[str]:
+            first, *others = [path.keys() for path in paths]
+            for other in others:
+                other = set(other)
+                first = [key for key in first if key in other]
+            return first
+        return AccessPath("index_intersection", ",".join(path.field for path in paths), estimate, cost, keys, tuple(paths))
+
+    def describe(self, path: AccessPath, estimate: float = None) -> ExplainPlan:
+        # estimated_rows is the filter's output; candidates is what the path reads.
+        plan = {
+            "method": path.method,
+            "field": path.field,
+            "estimated_rows": round(path.estimate if estimate is None else estimate),
+            "candidates": round(path.estimate),
+            "cost": round(path.cost, 1)
+        }
+        if path.children:
+            plan["children"] = [self.describe(child) for child in path.children]
+        return plan
+
+    @staticmethod
+    def scan_plan(rows: int, estimate: float) -> ExplainPlan:
+        return {"method": "full_scan", "field": None, "estimated_rows": round(estimate), "candidates": rows, "cost": round(rows * ROW_COST, 1)}
@@ -0,0 +1,94 @@
+import os
+from typing import Dict, List, Optional, Union
+from utils import MyDBUtils
+
+# Each operation is one bit, so a decision is a single AND against the
+# role's mask for the collection.
+OPERATIONS = ("select", "insert", "update", "delete", "transaction")
+OPERATION_BITS = {operation: 1 << i for i, operation in enumerate(OPERATIONS)}
+ALL_OPERATIONS = (1 << len(OPERATIONS)) - 1
+POLICY_ENV = "MYDB_POLICY"
+
+# Grants as loaded from config: role -> collection ("*" for any other) ->
+# operations ("*" for all). A plain list grants the same on every collection.
+RoleGrants = Union[List[str], Dict[str, List[str]]]
+
+DEFAULT_ROLES: Dict[str, RoleGrants] = {
+    "admin": ["insert", "select", "update", "delete", "transaction"],
+    "user": ["insert", "select", "update", "transaction"],
+    "guest": ["select"]
+}
+
+def compile_operations(operations: List[str]) -> int:
+    mask = 0
+    for operation in operations:
+        if operation == "*":
+            mask |= ALL_OPERATIONS
+        elif operation in OPERATION_BITS:
+            mask |= OPERATION_BITS[operation]
+        else:
+            raise ValueError(f"Unknown operation in policy: {operation}")
+    return mask
+
+def operation_names(mask: int) -> List[str]:
+    return [operation for operation in OPERATIONS if mask & OPERATION_BITS[operation]]
+
+class Grants:
+    """One role's compiled decisions: a bitmask per named collection and a default."""
+    __slots__ = ("role", "default", "collections")
+
+    def __init__(self, role: str, default: int, collections: Dict[str, int]):
+        self.role = role
+        self.default = default
+        self.collections = collections
+
+    def describe(self) -> Dict[str, List[str]]:
+        described = {"*": operation_names(self.default)}
+        described.update((name, operation_names(mask)) for name, mask in self.collections.items())
+        return described
+
+class Policy:
+    """Role -> collection -> operation grants, compiled to bitmasks once.
+
+    Lookups never walk the config: a role resolves to its Grants with one
+    dict lookup and a decision is one more lookup and an AND, however many
+    roles and collections the policy names.
+    """
+
+    def __init__(self, roles: Dict[str, RoleGrants], default_role: Optional[str] = None):
+        self.roles = roles
+        self.grants: Dict[str, Grants] = {role: self.compile(role, rules) for role, rules in roles.items()}
+        if default_role is None and "guest" in self.grants:
+            default_role = "guest"
+        if default_role is not None and default_role not in self.grants:
+            raise ValueError(f"Default role {default_role} is not defined in the policy")
+        # Role of a new session or CLI before set_role; None requires one.
+        self.default_role = default_role
+
+    @staticmethod
+    def compile(role: str, rules: RoleGrants) -> Grants:
+        if isinstance(rules, list):
+            return Grants(role, compile_operations(rules), {})
+        if not isinstance(rules, dict):
+            raise ValueError(f"Grants for role {role} must be a list or an object")
+        collections = {name: compile_operations(operations) for name, operations in rules.items() if name != "*"}
+        return Grants(role, compile_operations(rules.get("*", [])), collections)
+
+    @classmethod
+    def default(cls) -> 'Policy':
+        return cls(DEFAULT_ROLES)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'Policy':
+        """Policy from a JSON file ({"roles": {...}, "default_role": ...}), $MYDB_POLICY, or the built-in roles."""
+        path = path or os.environ.get(POLICY_ENV)
+        if not path:
+            return cls.default()
+        config = MyDBUtils.read_json(path)
+        roles = config.get("roles") if isinstance(config, dict) else None
+        if not isinstance(roles, dict):
+            raise ValueError(f"Policy file {path} has no roles object")
+        return cls(roles, config.get("default_role"))
+
+    def describe(self) -> Dict[str, Dict[str, List[str]]]:
+        return {role: grants.describe() for role, grants in self.grants.items()}
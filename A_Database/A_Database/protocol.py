@@ -0,0 +1,70 @@
+import asyncio
+import json
+import zlib
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+from storage import Storage
+
+# The wire format is the WAL's frame format: a ">II" header with the payload
+# length and its CRC32, followed by the compact JSON payload.
+#
+# Requests:  {"id": n, "op": "query", "args": {...}}
+# Responses: {"id": n, "ok": true, "result": ...}
+#            {"id": n, "ok": false, "error": "...", "type": "PermissionError"}
+# FETCH queries stream their rows instead of sending one result:
+#            {"id": n, "ok": true, "rows": [...], "more": true}  ... "more": false
+MAX_FRAME = 64 * 1024 * 1024
+DEFAULT_PORT = 7070
+
+class ProtocolError(Exception):
+    pass
+
+Address = Union[Tuple[str, int], str]
+
+def parse_address(address: str) -> Address:
+    """"host:port", ":port" or "unix:/path/to/socket"."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        host, port = address, str(DEFAULT_PORT)
+    return (host or "127.0.0.1", int(port))
+
+def encode_frame(message: Dict) -> bytes:
+    return Storage.encode_frame(message)
+
+def decode_payload(header: bytes, payload: bytes) -> Dict:
+    _, checksum = Storage.frame_header.unpack(header)
+    if zlib.crc32(payload) != checksum:
+        raise ProtocolError("Frame checksum mismatch")
+    return json.loads(payload)
+
+def payload_length(header: bytes) -> int:
+    length, _ = Storage.frame_header.unpack(header)
+    if length > MAX_FRAME:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+    return length
+
+async def read_message(reader) -> Optional[Dict]:
+    """Read one frame from an asyncio stream; None on a clean end of stream."""
+    try:
+        header = await reader.readexactly(Storage.frame_header.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError("Connection closed mid-frame")
+        return None
+    try:
+        payload = await reader.readexactly(payload_length(header))
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("Connection closed mid-frame")
+    return decode_payload(header, payload)
+
+def recv_message(stream: BinaryIO) -> Dict:
+    """Blocking counterpart of read_message for a socket's buffered reader."""
+    header = stream.read(Storage.frame_header.size)
+    if len(header) < Storage.frame_header.size:
+        raise ConnectionError("Server closed the connection")
+    length = payload_length(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ConnectionError("Server closed the connection mid-frame")
+    return decode_payload(header, payload)
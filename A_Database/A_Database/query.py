@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 from mydb_types import Conditions, Data, BulkData
 
 class QueryAction(Enum):
@@ -12,12 +12,29 @@ class QueryAction(Enum):
     TRANSACT = "TRANSACT"
     BULK_INSERT = "BULK_INSERT"
     EXPLAIN = "EXPLAIN"
+    AGGREGATE = "AGGREGATE"
+    JOIN = "JOIN"
 
 class Query:
     def __init__(self):
         self.action: QueryAction = None
         self.conditions: Conditions = {}
+        self.disjuncts: List[Conditions] = []
         self.data: Data = {}
         self.bulk_data: BulkData = []
         self.index_field: str = ""
-        self.transact_ops: List[Tuple[str, Conditions, Data]] = []
\ No newline at end of file
+        self.index_kind: str = "hash"
+        self.index_fields: List[str] = []
+        self.index_include: List[str] = []
+        self.transact_ops: List[Tuple[str, Conditions, Data]] = []
+        self.predicate: Callable = None
+        self.aggregates: List[Tuple[str, str]] = []
+        self.group_by: List[str] = []
+        self.join_collection: str = ""
+        self.join_left_field: str = ""
+        self.join_right_field: str = ""
+        self.limit: Optional[int] = None
+        self.offset: int = 0
+        self.fields: List[str] = []
+        self.order_by: str = ""
+        self.descending: bool = False
\ No newline at end of file
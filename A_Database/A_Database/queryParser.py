@@ -1,103 +1,296 @@
 import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, List
 from query import Query, QueryAction
-from mydb_types import Conditions, Data, BulkData
+from mydb_types import Conditions, Data, BulkData, Record
 
-def parse_my_query(query: str) -> Query:
-    q = Query()
+OR_SPLIT_RE = re.compile(r"\s+OR\s+")
+BULK_RECORD_RE = re.compile(r"\((.+?)\)(?:,|$)")
+ASSIGNMENT_RE = re.compile(r"(\w+)=('[^']*'|[0-9.]+)")
+CONDITION_RE = re.compile(r"(\w+)\s*([=><!]+|[$]\w+)\s*('[^']*'|[0-9.]+|\{[^{}]*\})")
+OPERATOR_RE = re.compile(r"([$]?\w+)\s*:\s*([0-9.]+|\[[^\]]*\])")
+QUOTED_RE = re.compile(r'"([^"]+)"')
+INIT_RE = re.compile(r"INIT", re.I)
+INSERT_RE = re.compile(r"ADD DATA \((.+)\)", re.I)
+BULK_INSERT_RE = re.compile(r"ADD BULK DATA \[(.+)\]", re.I)
+FETCH_TAIL = r"(?: FILTER \((.+?)\))?(?: ORDER BY (\w+)(?: (ASC|DESC))?)?(?: LIMIT (\d+))?(?: OFFSET (\d+))?(?: FIELDS \(([\w\s,]+)\))?\s*$"
+SELECT_RE = re.compile(r"FETCH" + FETCH_TAIL, re.I)
+EXPLAIN_RE = re.compile(r"EXPLAIN FETCH" + FETCH_TAIL, re.I)
+AGGREGATE_RE = re.compile(r"AGGREGATE (.+?)(?: FILTER \((.+)\))?(?: GROUP BY ([\w\s,]+))?$", re.I)
+JOIN_RE = re.compile(r"JOIN (\w+) ON (\w+)\s*=\s*(\w+)(?: FILTER \((.+)\))?$", re.I)
+AGGREGATE_FUNC_RE = re.compile(r"(COUNT|SUM|AVG|MIN|MAX)\s*\(\s*(\*|\w+)\s*\)", re.I)
+UPDATE_RE = re.compile(r"MODIFY FILTER \((.+)\) WITH \((.+)\)", re.I)
+DELETE_RE = re.compile(r"REMOVE FILTER \((.+)\)", re.I)
+INDEX_RE = re.compile(r"INDEX FIELD (\w+(?:\s*,\s*\w+)*)(?:\s+(HASH|ORDERED|COLUMNAR))?(?: INCLUDE \(([\w\s,]+)\))?\s*$", re.I)
+TRANSACT_RE = re.compile(r"TRANSACT OPS \((.+)\)", re.I)
+TRANSACT_OP_RE = re.compile(r"(?:ADD DATA \((.+?)\)|MODIFY FILTER \((.+?)\) WITH \((.+?)\)|REMOVE FILTER \((.+?)\))(?:;|$)")
+QUOTED_LITERAL_RE = re.compile(r"('[^']*')")
+WHITESPACE_RE = re.compile(r"\s+")
 
-    def parse_filter(text: str) -> dict:
-        result = {"type": "compare", "field": "", "operator": "", "value": ""}
-        match = re.match(r"(\w+)\s*([=><!]+)\s*('[^']*'|[0-9.]+)", text)
-        if match:
-            field, op, value = match.groups()
-            result["field"] = field
-            result["operator"] = op
-            result["value"] = value[1:-1] if value.startswith("'") else float(value)
-        elif "AND" in text or "OR" in text:
-            parts = re.split(r"\s+(AND|OR)\s+", text)
-            if len(parts) == 3:
-                left, op, right = parts
-                result = {
-                    "type": "logical",
-                    "operator": op,
-                    "left": parse_filter(left.strip()),
-                    "right": parse_filter(right.strip())
-                }
-        return result
+PLAN_CACHE_SIZE = 1024
+_plan_cache: "OrderedDict[str, Query]" = OrderedDict()
+_plan_cache_lock = Lock()
 
-    def parse_bulk_data(text: str) -> list:
-        result = []
-        for record_match in re.finditer(r"\((.+?)\)(?:,|$)", text):
-            record_text = record_match.group(1)
-            record = {}
-            for pair in re.finditer(r"(\w+)=('[^']*'|[0-9.]+)", record_text):
-                key, value = pair.groups()
-                record[key] = value[1:-1] if value.startswith("'") else value
-            result.append(record)
-        return result
+def compile_query(query: str) -> Query:
+    """Parse a query once per normalised text and attach its compiled predicate.
+
+    The returned Query is shared between callers and must not be mutated.
+    """
+    text = normalise_query(query)
+    with _plan_cache_lock:
+        q = _plan_cache.get(text)
+        if q is not None:
+            _plan_cache.move_to_end(text)
+            return q
+    q = parse_my_query(text)
+    if q.disjuncts:
+        q.predicate = compile_disjunction(q.disjuncts)
+    else:
+        q.predicate = compile_predicate(q.conditions)
+    with _plan_cache_lock:
+        _plan_cache[text] = q
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return q
+
+def normalise_query(query: str) -> str:
+    # Collapse whitespace outside quoted literals so formatting variants share a plan.
+    parts = QUOTED_LITERAL_RE.split(query.strip())
+    return "".join(part if i % 2 else WHITESPACE_RE.sub(" ", part) for i, part in enumerate(parts))
+
+def split_unquoted(text: str, split_re: re.Pattern) -> List[str]:
+    parts = [""]
+    for i, piece in enumerate(QUOTED_LITERAL_RE.split(text)):
+        if i % 2:
+            parts[-1] += piece
+            continue
+        pieces = split_re.split(piece)
+        parts[-1] += pieces[0]
+        parts.extend(pieces[1:])
+    return [part.strip() for part in parts]
+
+def apply_filter(q: Query, text: str):
+    """Set the filter's conditions; OR filters become disjuncts."""
+    branches = split_unquoted(text, OR_SPLIT_RE)
+    if len(branches) > 1:
+        q.disjuncts = [parse_conditions(branch) for branch in branches]
+    else:
+        q.conditions = parse_conditions(text)
+
+def parse_fetch(q: Query, m: re.Match):
+    filter_text, order_by, direction, limit, offset, fields = m.groups()
+    if filter_text:
+        apply_filter(q, filter_text)
+    if order_by:
+        q.order_by = order_by
+        q.descending = (direction or "ASC").upper() == "DESC"
+    if limit is not None:
+        q.limit = int(limit)
+    if offset is not None:
+        q.offset = int(offset)
+    if fields:
+        q.fields = [field.strip() for field in fields.split(",") if field.strip()]
+
+def parse_bulk_data(text: str) -> list:
+    result = []
+    for record_match in BULK_RECORD_RE.finditer(text):
+        record_text = record_match.group(1)
+        record = {}
+        for pair in ASSIGNMENT_RE.finditer(record_text):
+            key, value = pair.groups()
+            record[key] = value[1:-1] if value.startswith("'") else value
+        result.append(record)
+    return result
+
+def parse_assignments(text: str) -> Data:
+    return {k: v[1:-1] if v.startswith("'") else v for k, v in ASSIGNMENT_RE.findall(text)}
+
+def parse_my_query(query: str) -> Query:
+    q = Query()
 
-    if re.match(r"INIT", query, re.I):
+    if INIT_RE.match(query):
         q.action = QueryAction.CREATE
-    elif m := re.match(r"ADD DATA \((.+)\)", query, re.I):
+    elif m := INSERT_RE.match(query):
         q.action = QueryAction.INSERT
-        q.data = {k: v[1:-1] if v.startswith("'") else v for k, v in re.findall(r"(\w+)=('[^']*'|[0-9.]+)", m.group(1))}
-    elif m := re.match(r"ADD BULK DATA \[(.+)\]", query, re.I):
+        q.data = parse_assignments(m.group(1))
+    elif m := BULK_INSERT_RE.match(query):
         q.action = QueryAction.BULK_INSERT
         q.bulk_data = parse_bulk_data(m.group(1))
-    elif m := re.match(r"FETCH(?: FILTER \((.+)\))?", query, re.I):
+    elif m := SELECT_RE.match(query):
         q.action = QueryAction.SELECT
-        if m.group(1):
-            q.filter = parse_filter(m.group(1))
-            q.conditions = parse_conditions(m.group(1))
-    elif m := re.match(r"EXPLAIN FETCH(?: FILTER \((.+)\))?", query, re.I):
+        parse_fetch(q, m)
+    elif m := EXPLAIN_RE.match(query):
         q.action = QueryAction.EXPLAIN
-        if m.group(1):
-            q.filter = parse_filter(m.group(1))
-            q.conditions = parse_conditions(m.group(1))
-            print(f"Parsed EXPLAIN: filter={q.filter}, conditions={q.conditions}")
-    elif m := re.match(r"MODIFY FILTER \((.+)\) WITH \((.+)\)", query, re.I):
+        parse_fetch(q, m)
+    elif m := AGGREGATE_RE.match(query):
+        q.action = QueryAction.AGGREGATE
+        q.aggregates = [(func.upper(), field) for func, field in AGGREGATE_FUNC_RE.findall(m.group(1))]
+        if not q.aggregates:
+            raise ValueError("Invalid query: AGGREGATE needs COUNT/SUM/AVG/MIN/MAX(field)")
+        if m.group(2):
+            apply_filter(q, m.group(2))
+        if m.group(3):
+            q.group_by = [field.strip() for field in m.group(3).split(",") if field.strip()]
+    elif m := JOIN_RE.match(query):
+        q.action = QueryAction.JOIN
+        q.join_collection, q.join_left_field, q.join_right_field = m.group(1), m.group(2), m.group(3)
+        if m.group(4):
+            apply_filter(q, m.group(4))
+    elif m := UPDATE_RE.match(query):
         q.action = QueryAction.UPDATE
         q.conditions = parse_conditions(m.group(1))
-        q.data = {k: v[1:-1] if v.startswith("'") else v for k, v in re.findall(r"(\w+)=('[^']*'|[0-9.]+)", m.group(2))}
-    elif m := re.match(r"REMOVE FILTER \((.+)\)", query, re.I):
+        q.data = parse_assignments(m.group(2))
+    elif m := DELETE_RE.match(query):
         q.action = QueryAction.DELETE
         q.conditions = parse_conditions(m.group(1))
-    elif m := re.match(r"INDEX FIELD (\w+)", query, re.I):
+    elif m := INDEX_RE.match(query):
         q.action = QueryAction.INDEX
-        q.index_field = m.group(1)
-    elif m := re.match(r"TRANSACT OPS \((.+)\)", query, re.I):
+        q.index_fields = [field.strip() for field in m.group(1).split(",")]
+        q.index_field = q.index_fields[0]
+        q.index_kind = (m.group(2) or "hash").lower()
+        if m.group(3):
+            q.index_include = [field.strip() for field in m.group(3).split(",") if field.strip()]
+    elif m := TRANSACT_RE.match(query):
         q.action = QueryAction.TRANSACT
         ops_str = m.group(1)
-        for op in re.finditer(r"(?:ADD DATA \((.+?)\)|MODIFY FILTER \((.+?)\) WITH \((.+?)\)|REMOVE FILTER \((.+?)\))(?:;|$)", ops_str):
+        for op in TRANSACT_OP_RE.finditer(ops_str):
             if op.group(1):
-                q.transact_ops.append(("INSERT", {}, {k: v[1:-1] if v.startswith("'") else v for k, v in re.findall(r"(\w+)=('[^']*'|[0-9.]+)", op.group(1))}))
+                q.transact_ops.append(("INSERT", {}, parse_assignments(op.group(1))))
             elif op.group(2) and op.group(3):
-                q.transact_ops.append(("UPDATE", parse_conditions(op.group(2)), {k: v[1:-1] if v.startswith("'") else v for k, v in re.findall(r"(\w+)=('[^']*'|[0-9.]+)", op.group(3))}))
+                q.transact_ops.append(("UPDATE", parse_conditions(op.group(2)), parse_assignments(op.group(3))))
             elif op.group(4):
                 q.transact_ops.append(("DELETE", parse_conditions(op.group(4)), {}))
     else:
         raise ValueError("Invalid query")
     return q
 
+COMPARISON_OPS = {">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte", "!=": "$ne"}
+
 def parse_conditions(text: str) -> dict:
     result = {}
     if not text:
         return result
-    for pair in re.finditer(r"(\w+)\s*([=><!]+|[$]\w+)\s*('[^']*'|[0-9.]+|\{[^{}]*\})", text):
+    for pair in CONDITION_RE.finditer(text):
         key, op, value = pair.groups()
-        if value.startswith("'") and value.endswith("'"):
-            result[key] = value[1:-1]
-        elif value.startswith("{"):
+        if value.startswith("{"):
             ops = {}
             inner = value[1:-1]
-            for op_match in re.finditer(r"(\w+)\s*:\s*([0-9.]+|\[[^\]]*\])", inner):
+            for op_match in OPERATOR_RE.finditer(inner):
                 op_key, op_value = op_match.groups()
+                op_key = "$" + op_key.lstrip("$")
                 if op_value.startswith("["):
-                    values = re.findall(r'"([^"]+)"', op_value[1:-1])
+                    values = QUOTED_RE.findall(op_value[1:-1])
                     ops[op_key] = values
                 else:
                     ops[op_key] = float(op_value)
-            result[key] = ops
+        elif op == "=":
+            result[key] = value[1:-1] if value.startswith("'") else value
+            continue
         else:
-            result[key] = value
-    return result
\ No newline at end of file
+            # Comparison shorthand such as power > 300 becomes {"$gt": 300.0}.
+            op_key = COMPARISON_OPS.get(op, op)
+            literal = value[1:-1] if value.startswith("'") else value
+            if op_key == "$ne":
+                ops = {op_key: literal}
+            else:
+                try:
+                    ops = {op_key: float(literal)}
+                except ValueError:
+                    raise ValueError(f"Invalid numeric value for {key} {op}: {literal}")
+        if isinstance(result.get(key), dict):
+            result[key].update(ops)
+        else:
+            result[key] = ops
+    return result
+
+def compile_predicate(conditions: Conditions) -> Callable[[Record], bool]:
+    """Turn a conditions dict into a single callable with operators resolved.
+
+    Semantics match Collection.match_query: plain strings compare for
+    equality, range operators compare float(record_value) against constants
+    converted here once.
+    """
+    checks = []
+    equalities = []
+    for field, condition in conditions.items():
+        if isinstance(condition, str):
+            equalities.append((field, condition))
+        elif isinstance(condition, dict):
+            checks.append(compile_operators(field, condition))
+
+    def match_equalities(record: Record) -> bool:
+        for field, value in equalities:
+            if record.get(field) != value:
+                return False
+        return True
+
+    if equalities:
+        checks.insert(0, match_equalities)
+    if not checks:
+        return lambda record: True
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+
+    def match_all(record: Record) -> bool:
+        for check in checks:
+            if not check(record):
+                return False
+        return True
+    return match_all
+
+def compile_disjunction(disjuncts: List[Conditions]) -> Callable[[Record], bool]:
+    branches = tuple(compile_predicate(conditions) for conditions in disjuncts)
+
+    def match_any(record: Record) -> bool:
+        for branch in branches:
+            if branch(record):
+                return True
+        return False
+    return match_any
+
+def compile_operators(field: str, ops: dict) -> Callable[[Record], bool]:
+    missing = object()
+    not_equal = ops.get("$ne", missing)
+    members = ops.get("$in")
+    if members is not None:
+        try:
+            members = frozenset(members)
+        except TypeError:
+            members = tuple(members)
+    low, low_inclusive, high, high_inclusive = None, True, None, True
+    for op, value in ops.items():
+        if op in ("$gt", "$gte"):
+            inclusive = op == "$gte"
+            if low is None or value > low or (value == low and not inclusive):
+                low, low_inclusive = value, inclusive
+        elif op in ("$lt", "$lte"):
+            inclusive = op == "$lte"
+            if high is None or value < high or (value == high and not inclusive):
+                high, high_inclusive = value, inclusive
+    has_range = low is not None or high is not None
+
+    def check(record: Record) -> bool:
+        value = record.get(field)
+        if value is None:
+            return False
+        if not_equal is not missing and value == not_equal:
+            return False
+        if members is not None:
+            try:
+                if value not in members:
+                    return False
+            except TypeError:
+                return False
+        if has_range:
+            try:
+                number = float(value)
+            except (ValueError, TypeError):
+                return False
+            if low is not None and (number < low or (number == low and not low_inclusive)):
+                return False
+            if high is not None and (number > high or (number == high and not high_inclusive)):
+                return False
+        return True
+    return check
@@ -1,45 +1,111 @@
-import hashlib
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Sequence
+from fieldcrypt import FieldCipher, default_cipher
 from logger import Logger
+from policy import OPERATION_BITS, Grants, Policy
+
+# Values whose ciphertext/plaintext can be cached; containers are always
+# encrypted and decrypted afresh so cached values are never shared mutably.
+SCALARS = (str, int, float, bool, type(None))
+MISSING = object()
 
 class Security:
-    def __init__(self, logger: Logger):
+    CACHE_SIZE = 65536
+
+    def __init__(self, logger: Logger, cipher: Optional[FieldCipher] = None, policy: Optional[Policy] = None):
         self.logger = logger
-        self.roles = {
-            "admin": ["insert", "select", "update", "delete"],
-            "user": ["insert", "select", "update"],
-            "guest": ["select"]
-        }
+        self.cipher = cipher or default_cipher()
+        self.policy = policy or Policy.default()
+        # Deterministic ciphertext repeats with its value, and a stored value
+        # is decrypted again by every query that returns it.
+        self.encrypted: Dict[Any, str] = {}
+        self.decrypted: Dict[str, Any] = {}
 
-    def restrict_access(self, operation: str, role: str, collection_name: str):
-        if role not in self.roles:
-            self.logger.error(f"Invalid role: {role}")
+    def set_policy(self, policy: Policy):
+        # Swapped as a whole, so a check sees either the old or the new grants.
+        self.policy = policy
+        self.logger.info("Loaded access policy with roles: %s", ', '.join(policy.grants))
+
+    def grants(self, role: str) -> Grants:
+        grants = self.policy.grants.get(role)
+        if grants is None and role is None:
+            raise ValueError("No role set and the policy has no default role")
+        if grants is None:
+            self.logger.error("Invalid role: %s", role)
             raise ValueError(f"Invalid role: {role}")
-        if operation not in self.roles[role]:
-            self.logger.error(f"Operation {operation} not allowed for role {role} on collection {collection_name}")
+        return grants
+
+    def restrict_access(self, operation: str, role: str, collection_name: str):
+        grants = self.grants(role)
+        if not grants.collections.get(collection_name, grants.default) & OPERATION_BITS.get(operation, 0):
+            self.logger.error("Operation %s not allowed for role %s on collection %s", operation, role, collection_name)
             raise PermissionError(f"Operation {operation} not allowed for role {role}")
 
-    def encrypt_sensitive_fields(self, record: Dict, sensitive_fields: List[str]) -> Dict:
+    def encrypt_sensitive_fields(self, record: Dict, sensitive_fields: List[str],
+                                 randomized: Sequence[str] = ()) -> Dict:
+        """Copy of record with its sensitive fields encrypted; record itself if it has none.
+
+        Fields in ``randomized`` get randomized ciphertext; the others are
+        deterministic so equality filters and hash indexes work on them.
+        """
+        fields = [field for field in sensitive_fields if record.get(field) is not None]
+        if not fields:
+            return record
         encrypted_record = record.copy()
-        for field in sensitive_fields:
-            if field in encrypted_record:
-                encrypted_record[field] = self._encrypt(encrypted_record[field])
-                self.logger.debug(f"Encrypted field: {field}")
+        for field in fields:
+            encrypted_record[field] = self.protect_value(record[field], field not in randomized)
         return encrypted_record
 
+    def encrypt_records(self, records: List[Dict], sensitive_fields: List[str],
+                        randomized: Sequence[str] = ()) -> List[Dict]:
+        # Batch form for bulk loads: one field at a time across the batch, so
+        # repeated values cost one cipher call and the loop stays tight.
+        encrypted = [record.copy() for record in records]
+        protect = self.protect_value
+        for field in sensitive_fields:
+            deterministic = field not in randomized
+            for record in encrypted:
+                value = record.get(field)
+                if value is not None:
+                    record[field] = protect(value, deterministic)
+        self.logger.debug("Encrypted fields %s in %d records", list(sensitive_fields), len(records))
+        return encrypted
+
     def decrypt_sensitive_fields(self, record: Dict, sensitive_fields: List[str]) -> Dict:
-        decrypted_record = record.copy()
+        return self.reveal_fields(record.copy(), sensitive_fields)
+
+    def reveal_fields(self, record: Dict, sensitive_fields: List[str]) -> Dict:
+        """Decrypt in place the sensitive fields present in an output row."""
         for field in sensitive_fields:
-            if field in decrypted_record:
-                decrypted_record[field] = self._decrypt(decrypted_record[field])
-                self.logger.debug(f"Decrypted field: {field}")
-        return decrypted_record
+            value = record.get(field)
+            if value is not None:
+                record[field] = self.reveal_value(value)
+        return record
+
+    def protect_value(self, value: Any, deterministic: bool = True) -> str:
+        if not deterministic or not isinstance(value, SCALARS):
+            return self.cipher.encrypt(value, deterministic)
+        key = (type(value), value)  # 1, 1.0 and True encrypt differently
+        token = self.encrypted.get(key)
+        if token is None:
+            token = self.cipher.encrypt(value, True)
+            self.remember(self.encrypted, key, token)
+        return token
 
-    def _encrypt(self, data: str) -> str:
-        return hashlib.sha256(data.encode()).hexdigest()
+    def reveal_value(self, value: Any) -> Any:
+        if not isinstance(value, str):
+            return value  # ciphertext is always a string
+        plain = self.decrypted.get(value, MISSING)
+        if plain is MISSING:
+            plain = self.cipher.decrypt(value)
+            if plain is not value and isinstance(plain, SCALARS):
+                self.remember(self.decrypted, value, plain)
+        return plain
 
-    def _decrypt(self, data: str) -> str:
-        return data  # Note: SHA-256 is one-way; this is a placeholder
+    def remember(self, cache: Dict, key: Any, value: Any):
+        if len(cache) >= self.CACHE_SIZE:
+            cache.clear()
+        cache[key] = value
 
-    def get_roles(self) -> Dict[str, List[str]]:
-        return self.roles
\ No newline at end of file
+    def get_roles(self) -> Dict[str, Dict[str, List[str]]]:
+        # Role -> collection ("*" for the default) -> allowed operations.
+        return self.policy.describe()
\ No newline at end of file
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Set
+from database import MyDB, Collection
+from logger import Logger
+from protocol import Address, ProtocolError, encode_frame, parse_address, read_message
+
+class Session:
+    """Per-connection state: the role requests run as and the selected collection."""
+
+    def __init__(self, peer: str, role: Optional[str]):
+        self.peer = peer
+        self.role = role
+        self.collection: Optional[str] = None
+
+class Server:
+    """asyncio front end that keeps one warm MyDB in memory for many clients.
+
+    Requests are framed JSON (see protocol.py) carrying the same operations
+    and query language as the CLI. Database calls block on collection locks
+    and disk, so they run on a thread pool; the event loop only moves frames.
+    Requests on one connection are answered in order, and FETCH rows are
+    streamed in batches rather than sent as one result.
+    """
+
+    def __init__(self, db: MyDB, workers: int = 8, batch_size: int = 500):
+        self.db = db
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mydb-worker")
+        self.logger = Logger("Server", log_file="server.log")
+        self.security = db.security
+        self.sessions: Set[Session] = set()
+        self.handlers = {
+            "ping": self.ping,
+            "set_role": self.set_role,
+            "use": self.use,
+            "create_collection": self.create_collection,
+            "list_collections": self.list_collections,
+            "list_roles": self.list_roles,
+            "query": self.query,
+            "explain": self.explain,
+            "insert": self.insert,
+            "bulk_insert": self.bulk_insert,
+            "update": self.update,
+            "delete": self.delete,
+            "transaction": self.transaction,
+            "create_index": self.create_index,
+            "create_compound_index": self.create_compound_index,
+            "drop_index": self.drop_index,
+            "index_advice": self.index_advice,
+            "apply_index_advice": self.apply_index_advice,
+            "index_usage": self.index_usage,
+        }
+
+    async def serve(self, address: Address, stop: asyncio.Event):
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)  # stale socket from a previous run
+            server = await asyncio.start_unix_server(self.handle_connection, path=address)
+        else:
+            server = await asyncio.start_server(self.handle_connection, *address)
+        self.logger.info("Listening on %s", address)
+        async with server:
+            await stop.wait()
+        self.logger.info("Server stopped")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = str(writer.get_extra_info("peername") or writer.get_extra_info("sockname"))
+        session = Session(peer, self.security.policy.default_role)
+        self.sessions.add(session)
+        self.logger.info("Client connected: %s", peer)
+        try:
+            while True:
+                request = await read_message(reader)
+                if request is None:
+                    break
+                await self.dispatch(session, request, writer)
+        except (ProtocolError, ConnectionError) as e:
+            self.logger.warning("Dropping client %s: %s", peer, e)
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.logger.info("Client disconnected: %s", peer)
+
+    async def dispatch(self, session: Session, request: Dict, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        request_id = request.get("id")
+        op = request.get("op")
+        args = request.get("args") or {}
+        try:
+            if op == "find":
+                await self.stream_rows(session, request_id, args, writer)
+                return
+            handler = self.handlers.get(op)
+            if handler is None:
+                raise ValueError(f"Unknown operation: {op}")
+            result = await loop.run_in_executor(self.executor, handler, session, args)
+            writer.write(encode_frame({"id": request_id, "ok": True, "result": result}))
+        except Exception as e:
+            self.logger.error("%s failed for %s: %s", op, session.peer, e)
+            writer.write(encode_frame({"id": request_id, "ok": False, "error": str(e), "type": type(e).__name__}))
+        await writer.drain()
+
+    async def stream_rows(self, session: Session, request_id: int, args: Dict, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        collection = self.collection(session, args)
+        rows = collection.find_iter(args.get("query", ""), session.role, self.batch_size)
+        while True:
+            # find_iter takes a short read lock per batch, so pull each batch
+            # on the pool and let drain() apply backpressure from the socket.
+            batch = await loop.run_in_executor(self.executor, list, islice(rows, self.batch_size))
+            more = len(batch) == self.batch_size
+            writer.write(encode_frame({"id": request_id, "ok": True, "rows": batch, "more": more}))
+            await writer.drain()
+            if not more:
+                return
+
+    def collection(self, session: Session, args: Dict) -> Collection:
+        name = args.get("collection") or session.collection
+        if not name:
+            raise ValueError("No collection selected")
+        collection = self.db.collections.get(name)
+        if collection is None:
+            raise ValueError(f"Unknown collection: {name}")
+        return collection
+
+    @staticmethod
+    def describe(collection: Collection) -> Dict:
+        return {"name": collection.name, "sensitive_fields": collection.sensitive_fields,
+                "randomized_fields": collection.randomized_fields, "records": len(collection.data)}
+
+    def ping(self, session: Session, args: Dict) -> str:
+        return "pong"
+
+    def set_role(self, session: Session, args: Dict) -> str:
+        session.role = self.security.grants(args.get("role")).role  # rejects unknown roles
+        return session.role
+
+    def use(self, session: Session, args: Dict) -> Dict:
+        collection = self.collection(session, args)
+        session.collection = collection.name
+        return self.describe(collection)
+
+    def create_collection(self, session: Session, args: Dict) -> Dict:
+        collection = self.db.create_collection(args.get("collection", ""), args.get("schema"),
+                                               args.get("sensitive_fields"), args.get("id_style", "int"),
+                                               args.get("randomized_fields"))
+        session.collection = collection.name
+        return self.describe(collection)
+
+    def list_collections(self, session: Session, args: Dict) -> List[str]:
+        return list(self.db.collections)
+
+    def list_roles(self, session: Session, args: Dict) -> Dict:
+        return self.security.get_roles()
+
+    def query(self, session: Session, args: Dict) -> List[Dict]:
+        return self.collection(session, args).parse_query(args.get("query", ""), session.role)
+
+    def explain(self, session: Session, args: Dict) -> Dict:
+        return self.collection(session, args).explain(args.get("query", ""), session.role)
+
+    def insert(self, session: Session, args: Dict) -> str:
+        return self.collection(session, args).insert(args.get("data") or {}, session.role)
+
+    def bulk_insert(self, session: Session, args: Dict) -> List[str]:
+        return self.collection(session, args).bulk_insert(args.get("records") or [], session.role)
+
+    def update(self, session: Session, args: Dict) -> int:
+        return self.collection(session, args).update(args.get("operations") or {}, args.get("data") or {}, session.role)
+
+    def delete(self, session: Session, args: Dict) -> int:
+        return self.collection(session, args).delete(args.get("data") or {}, session.role)
+
+    def transaction(self, session: Session, args: Dict) -> bool:
+        return self.collection(session, args).transaction(args.get("operations") or [], session.role)
+
+    def create_index(self, session: Session, args: Dict) -> None:
+        self.collection(session, args).create_index(args.get("field", ""), args.get("kind", "hash"), session.role)
+
+    def create_compound_index(self, session: Session, args: Dict) -> None:
+        self.collection(session, args).create_compound_index(args.get("fields") or [], args.get("include"), session.role)
+
+    def drop_index(self, session: Session, args: Dict) -> None:
+        self.collection(session, args).drop_index(args.get("field", ""), session.role)
+
+    def index_advice(self, session: Session, args: Dict) -> List[Dict]:
+        return self.collection(session, args).index_advice()
+
+    def apply_index_advice(self, session: Session, args: Dict) -> List[Dict]:
+        return self.collection(session, args).apply_index_advice()
+
+    def index_usage(self, session: Session, args: Dict) -> Dict:
+        return self.collection(session, args).index_usage()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generic NoSQL JSON Database server")
+    parser.add_argument("--listen", default="127.0.0.1:7070", help="host:port or unix:/path/to/socket")
+    parser.add_argument("--workers", type=int, default=8, help="Threads running database operations")
+    parser.add_argument("--auto-index", action="store_true", help="Create and drop indexes automatically from the observed workload")
+    parser.add_argument("--wal-sync", choices=["always", "batch", "os"], default="batch", help="WAL durability: fsync every write, group commit, or leave to the OS")
+    parser.add_argument("--policy", help="JSON access policy: role -> collection -> operations (default: $MYDB_POLICY or built-in roles)")
+    args = parser.parse_args()
+
+    server = Server(MyDB(wal_sync=args.wal_sync, auto_index=args.auto_index, policy_file=args.policy), workers=args.workers)
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except NotImplementedError:
+                pass  # Windows: fall back to KeyboardInterrupt
+        await server.serve(parse_address(args.listen), stop)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,140 @@
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+from mydb_types import Record
+from index import to_number
+
+class Histogram:
+    """Equi-depth histogram over the numeric values of one field.
+
+    Bucket bounds are fixed when the histogram is built; writes move the
+    bucket counts, and ``Statistics`` rebuilds the bounds once enough rows
+    have changed for them to drift.
+    """
+
+    def __init__(self, numbers: List[float], buckets: int = 32):
+        numbers = sorted(numbers)
+        self.low: Optional[float] = numbers[0] if numbers else None
+        self.bounds: List[float] = []
+        self.counts: List[int] = []
+        if not numbers:
+            return
+        step = max(1, -(-len(numbers) // buckets))
+        start = 0
+        while start < len(numbers):
+            end = min(len(numbers), start + step)
+            # Keep equal values in one bucket so bounds stay strictly increasing.
+            while end < len(numbers) and numbers[end] == numbers[end - 1]:
+                end += 1
+            self.bounds.append(numbers[end - 1])
+            self.counts.append(end - start)
+            start = end
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def add(self, number: float):
+        if not self.bounds:
+            self.low = number
+            self.bounds.append(number)
+            self.counts.append(1)
+            return
+        if number < self.low:
+            self.low = number
+        pos = bisect_left(self.bounds, number)
+        if pos == len(self.bounds):
+            pos -= 1
+            self.bounds[pos] = number
+        self.counts[pos] += 1
+
+    def remove(self, number: float):
+        if not self.bounds:
+            return
+        pos = min(bisect_left(self.bounds, number), len(self.bounds) - 1)
+        if self.counts[pos]:
+            self.counts[pos] -= 1
+
+    def estimate(self, ops: Dict[str, Any]) -> float:
+        """Approximate number of values satisfying the range operators."""
+        if not self.bounds:
+            return 0.0
+        low, high = float("-inf"), float("inf")
+        for op, bound in ops.items():
+            if op in ("$gt", "$gte"):
+                low = max(low, bound)
+            elif op in ("$lt", "$lte"):
+                high = min(high, bound)
+        if low > high:
+            return 0.0
+        total = 0.0
+        start = self.low
+        for bound, count in zip(self.bounds, self.counts):
+            if count and high >= start and low <= bound:
+                width = bound - start
+                if width <= 0:
+                    total += count
+                else:
+                    overlap = min(high, bound) - max(low, start)
+                    total += count * min(1.0, max(overlap, 0.0) / width)
+            start = bound
+        return total
+
+class Statistics:
+    """Planner statistics for one collection.
+
+    Row and distinct counts come straight from the data and hash indexes;
+    this keeps the numeric histograms of indexed fields, updated on every
+    write and rebuilt when the changes since the last build exceed
+    ``REBUILD_FRACTION`` of the rows.
+    """
+    REBUILD_FRACTION = 0.2
+    MIN_REBUILD = 1000
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.modifications = 0
+
+    def build(self, field: str, index: Dict):
+        numbers = []
+        for value, posting in index.items():
+            number = self._number(value)
+            if number is not None:
+                numbers.extend([number] * len(posting))
+        self.histograms[field] = Histogram(numbers)
+
+    def drop(self, field: str):
+        self.histograms.pop(field, None)
+
+    def update(self, old_record: Optional[Record], new_record: Optional[Record]):
+        for field, histogram in self.histograms.items():
+            old = self._number(old_record.get(field)) if old_record is not None else None
+            new = self._number(new_record.get(field)) if new_record is not None else None
+            if old == new:
+                continue
+            if old is not None:
+                histogram.remove(old)
+            if new is not None:
+                histogram.add(new)
+        self.modifications += 1
+
+    def needs_rebuild(self, rows: int) -> bool:
+        return bool(self.histograms) and self.modifications >= max(self.MIN_REBUILD, rows * self.REBUILD_FRACTION)
+
+    def rebuild(self, indexes: Dict[str, Dict]):
+        for field in list(self.histograms):
+            if field in indexes:
+                self.build(field, indexes[field])
+            else:
+                self.drop(field)
+        self.modifications = 0
+
+    def estimate_range(self, field: str, ops: Dict[str, Any], rows: int) -> float:
+        histogram = self.histograms.get(field)
+        if histogram is None:
+            return rows / 3
+        return histogram.estimate(ops)
+
+    @staticmethod
+    def _number(value: Any) -> Optional[float]:
+        number = to_number(value)
+        return number if number == number else None
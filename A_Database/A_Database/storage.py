@@ -1,11 +1,14 @@
 import json
 import os
-from mydb_types import Records, Indexes
-from typing import Dict, List
-from mydb_types import Data, Conditions
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from mydb_types import Records, Record, Indexes
+from typing import Dict, List, TextIO
 
 class Storage:
-    log_file = "mydb.log"
+    # WAL frame header: payload length and CRC32 of the JSON payload.
+    frame_header = struct.Struct(">II")
 
     @staticmethod
     def to_json(data: Dict) -> str:
@@ -39,6 +42,31 @@ class Storage:
         with open(db_file, "w") as f:
             f.write(Storage.to_json(data))
 
+    @staticmethod
+    def fsync_file(f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    @staticmethod
+    def fsync_dir(directory: str):
+        # Makes a rename or a new file in ``directory`` durable. Windows
+        # cannot open directories, so this is a no-op there.
+        if os.name != "posix":
+            return
+        fd = os.open(directory or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def create_engine(name: str, db_file: str = "mydb_data.json") -> "StorageEngine":
+        if name == "json":
+            return JsonFileEngine(db_file)
+        if name == "segment":
+            return SegmentEngine()
+        raise ValueError(f"Unknown storage engine: {name}")
+
     @staticmethod
     def load_indexes(index_file: str) -> Indexes:
         try:
@@ -53,24 +81,256 @@ class Storage:
             f.write(Storage.to_json(indexes))
 
     @staticmethod
-    def log_operation(op_type: str, key: str = None, data: Data = None, conditions: Conditions = None):
-        log_entry = {"op_type": op_type, "key": key, "data": data, "conditions": conditions}
-        with open(Storage.log_file, "a") as f:
-            f.write(Storage.to_json(log_entry) + "\n")
-        print(f"Logged operation: {op_type}, key={key}, data={data}, conditions={conditions}")
+    def encode_frame(entry: Dict) -> bytes:
+        payload = Storage.to_json(entry).encode()
+        return Storage.frame_header.pack(len(payload), zlib.crc32(payload)) + payload
 
     @staticmethod
-    def read_log() -> List[Dict]:
-        logs = []
+    def read_frames(log_file: str) -> List[Dict]:
+        frames = []
         try:
-            with open(Storage.log_file, "r") as f:
-                for line in f:
-                    logs.append(Storage.parse_json(line.strip()))
+            with open(log_file, "rb") as f:
+                content = f.read()
         except FileNotFoundError:
             return []
-        return logs
+        pos = 0
+        header_size = Storage.frame_header.size
+        while pos + header_size <= len(content):
+            length, checksum = Storage.frame_header.unpack_from(content, pos)
+            payload = content[pos + header_size:pos + header_size + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                # Torn or corrupt tail from a crash mid-write; nothing after it is trusted.
+                break
+            frames.append(json.loads(payload))
+            pos += header_size + length
+        return frames
 
-    @staticmethod
-    def clear_log():
-        if os.path.exists(Storage.log_file):
-            os.remove(Storage.log_file)
\ No newline at end of file
+
+class StorageEngine(ABC):
+    """Base class for the pluggable persistence layer behind MyDB.
+
+    ``incremental`` engines can persist a single record change; the others
+    only support whole-database snapshots through ``save_all``.
+    """
+    incremental = False
+
+    @abstractmethod
+    def load(self) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    def save_all(self, data: Dict[str, Dict]):
+        ...
+
+    def needs_compaction(self, collection_name: str, live: int) -> bool:
+        return False
+
+    def compact(self, collection_name: str, data: Records):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class IncrementalEngine(StorageEngine):
+    """Engine that also persists one collection's metadata or records at a time."""
+    incremental = True
+
+    @abstractmethod
+    def save_meta(self, collection_name: str, meta: Dict):
+        ...
+
+    @abstractmethod
+    def put(self, collection_name: str, key: str, record: Record):
+        ...
+
+    def put_many(self, collection_name: str, records: Records):
+        for key, record in records.items():
+            self.put(collection_name, key, record)
+
+    @abstractmethod
+    def delete(self, collection_name: str, key: str):
+        ...
+
+    def delete_many(self, collection_name: str, keys: List[str]):
+        for key in keys:
+            self.delete(collection_name, key)
+
+
+class JsonFileEngine(StorageEngine):
+    """Original single-file layout: every save rewrites ``mydb_data.json``."""
+
+    def __init__(self, db_file: str = "mydb_data.json"):
+        self.db_file = db_file
+        if not os.path.exists(self.db_file):
+            Storage.save_db(self.db_file, {})
+
+    def load(self) -> Dict[str, Dict]:
+        return Storage.load_db(self.db_file)
+
+    def save_all(self, data: Dict[str, Dict]):
+        Storage.save_db(self.db_file, data)
+
+    def sync(self):
+        with open(self.db_file, "rb") as f:
+            os.fsync(f.fileno())
+
+
+class SegmentEngine(IncrementalEngine):
+    """Per-collection append-only segment files with periodic compaction.
+
+    Layout::
+
+        <root>/<collection>/meta.json       schema, sensitive fields, index fields
+        <root>/<collection>/000001.seg      one JSON entry per line
+
+    Every entry is either ``{"k": key, "r": record}`` (put) or
+    ``{"k": key, "d": 1}`` (delete); the last entry for a key wins on load.
+    A collection is compacted once its dead entries outnumber the live ones.
+    """
+
+    def __init__(self, root: str = "mydb_segments", segment_max_bytes: int = 16 * 1024 * 1024,
+                 compact_min_entries: int = 1000):
+        self.root = root
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_min_entries = compact_min_entries
+        self.handles: Dict[str, TextIO] = {}
+        self.entries: Dict[str, int] = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def collection_dir(self, collection_name: str) -> str:
+        return os.path.join(self.root, collection_name)
+
+    def segments(self, collection_name: str) -> List[str]:
+        directory = self.collection_dir(collection_name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".seg"))
+
+    def load(self) -> Dict[str, Dict]:
+        result = {}
+        for collection_name in sorted(os.listdir(self.root)):
+            meta_file = os.path.join(self.collection_dir(collection_name), "meta.json")
+            if not os.path.exists(meta_file):
+                continue
+            with open(meta_file, "r") as f:
+                meta = Storage.parse_json(f.read())
+            data: Records = {}
+            entries = 0
+            for segment in self.segments(collection_name):
+                with open(segment, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn final line from a crash; the WAL replays it.
+                            break
+                        entries += 1
+                        if entry.get("d"):
+                            data.pop(entry["k"], None)
+                        else:
+                            data[entry["k"]] = entry["r"]
+            self.entries[collection_name] = entries
+            meta["data"] = data
+            result[collection_name] = meta
+        return result
+
+    def save_all(self, data: Dict[str, Dict]):
+        for collection_name, collection_data in data.items():
+            # Indexes are rebuilt from "index_fields" on load rather than stored.
+            meta = {k: v for k, v in collection_data.items() if k not in ("data", "indexes")}
+            self.save_meta(collection_name, meta)
+            self.compact(collection_name, collection_data.get("data", {}))
+
+    def save_meta(self, collection_name: str, meta: Dict):
+        directory = self.collection_dir(collection_name)
+        os.makedirs(directory, exist_ok=True)
+        meta_file = os.path.join(directory, "meta.json")
+        tmp_file = meta_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write(Storage.to_json(meta))
+            Storage.fsync_file(f)
+        os.replace(tmp_file, meta_file)
+        Storage.fsync_dir(directory)
+
+    def _handle(self, collection_name: str) -> TextIO:
+        handle = self.handles.get(collection_name)
+        if handle is not None and handle.tell() < self.segment_max_bytes:
+            return handle
+        if handle is not None:
+            # A full segment leaves ``handles`` here, so sync() would never
+            # reach it: make it durable before letting go.
+            Storage.fsync_file(handle)
+            handle.close()
+        segments = self.segments(collection_name)
+        if segments and os.path.getsize(segments[-1]) < self.segment_max_bytes:
+            path = segments[-1]
+            handle = open(path, "a")
+        else:
+            number = int(os.path.basename(segments[-1])[:-4]) + 1 if segments else 1
+            directory = self.collection_dir(collection_name)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{number:06d}.seg")
+            handle = open(path, "a")
+            Storage.fsync_dir(directory)
+        self.handles[collection_name] = handle
+        return handle
+
+    def _append(self, collection_name: str, lines: List[str]):
+        handle = self._handle(collection_name)
+        handle.write("".join(lines))
+        handle.flush()
+        self.entries[collection_name] = self.entries.get(collection_name, 0) + len(lines)
+
+    def put(self, collection_name: str, key: str, record: Record):
+        self._append(collection_name, [Storage.to_json({"k": key, "r": record}) + "\n"])
+
+    def put_many(self, collection_name: str, records: Records):
+        if records:
+            self._append(collection_name, [Storage.to_json({"k": k, "r": r}) + "\n" for k, r in records.items()])
+
+    def delete(self, collection_name: str, key: str):
+        self._append(collection_name, [Storage.to_json({"k": key, "d": 1}) + "\n"])
+
+    def delete_many(self, collection_name: str, keys: List[str]):
+        if keys:
+            self._append(collection_name, [Storage.to_json({"k": key, "d": 1}) + "\n" for key in keys])
+
+    def needs_compaction(self, collection_name: str, live: int) -> bool:
+        entries = self.entries.get(collection_name, 0)
+        return entries >= self.compact_min_entries and entries - live > live
+
+    def compact(self, collection_name: str, data: Records):
+        old_segments = self.segments(collection_name)
+        handle = self.handles.pop(collection_name, None)
+        if handle is not None:
+            handle.close()
+        directory = self.collection_dir(collection_name)
+        os.makedirs(directory, exist_ok=True)
+        number = int(os.path.basename(old_segments[-1])[:-4]) + 1 if old_segments else 1
+        path = os.path.join(directory, f"{number:06d}.seg")
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w") as f:
+            for key, record in data.items():
+                f.write(Storage.to_json({"k": key, "r": record}) + "\n")
+            Storage.fsync_file(f)
+        os.replace(tmp_file, path)
+        Storage.fsync_dir(directory)
+        for segment in old_segments:
+            os.remove(segment)
+        self.entries[collection_name] = len(data)
+
+    def sync(self):
+        for handle in self.handles.values():
+            Storage.fsync_file(handle)
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
@@ -1,46 +1,174 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from database import Collection
 from logger import Logger
-from storage import Storage
+from mydb_types import Conditions, Data, Record
+from queryParser import compile_predicate
+
+class TransactionConflict(Exception):
+    pass
 
 class Transaction:
+    """Optimistic transaction over one collection.
+
+    Reads come from a snapshot taken when the transaction starts and writes
+    are staged in a private write-set, so nothing is locked until commit.
+    Commit takes the write lock and fails with TransactionConflict if a
+    record it wrote, or one matching its update/delete filters, changed
+    since the snapshot. Otherwise the write-set is applied once: one WAL
+    frame from BEGIN to COMMIT, one index delta per key and one storage
+    write. An undo log of replaced records restores memory if applying
+    fails part way.
+    """
+
     def __init__(self, collection: Collection):
         self.collection = collection
         self.logger = Logger("Transaction", log_file="transaction.log")
-        self.original_data = collection.data.copy()
-        self.original_indexes = collection.indexes.copy()
-        self.operations = []
+        self.snapshot = collection.snapshot()
+        self.writes: Dict[str, Optional[Record]] = {}  # None stages a delete
+        self.filters: List[Conditions] = []
+        self.undo: List[Tuple[str, Optional[Record]]] = []
+        self.finished = False
+
+    def insert(self, record: Data, user_role: str) -> str:
+        collection = self.collection
+        collection.security.restrict_access("insert", user_role, collection.name)
+        collection.validate_record(record)
+        key = collection.ids.allocate()
+        record = dict(record, _id=key, created_at=collection.current_time())
+        self.writes[key] = collection.security.encrypt_sensitive_fields(record, collection.sensitive_fields,
+                                                                        collection.randomized_fields)
+        self.logger.info("Staged insert: %s", key)
+        return key
 
-    def insert(self, record: Dict, user_role: str):
-        self.operations.append(("insert", record, user_role))
-        self.logger.info(f"Queued insert: {record}")
+    def update(self, condition: Dict, update_data: Dict, user_role: str) -> int:
+        collection = self.collection
+        collection.security.restrict_access("update", user_role, collection.name)
+        changes = collection.security.encrypt_sensitive_fields(update_data, collection.sensitive_fields,
+                                                               collection.randomized_fields)
+        updated_at = collection.current_time()
+        matched = self.matching(condition)
+        for key, record in matched:
+            new_record = record.copy()
+            new_record.update(changes)
+            new_record["updated_at"] = updated_at
+            self.writes[key] = new_record
+        self.logger.info("Staged update of %d records: condition=%s", len(matched), condition)
+        return len(matched)
 
-    def update(self, condition: Dict, update_data: Dict, user_role: str):
-        self.operations.append(("update", condition, update_data, user_role))
-        self.logger.info(f"Queued update: condition={condition}, data={update_data}")
+    def delete(self, condition: Dict, user_role: str) -> int:
+        collection = self.collection
+        collection.security.restrict_access("delete", user_role, collection.name)
+        matched = self.matching(condition)
+        for key, _ in matched:
+            self.writes[key] = None
+        self.logger.info("Staged delete of %d records: condition=%s", len(matched), condition)
+        return len(matched)
 
-    def delete(self, condition: Dict, user_role: str):
-        self.operations.append(("delete", condition, user_role))
-        self.logger.info(f"Queued delete: condition={condition}")
+    def matching(self, conditions: Conditions) -> List[Tuple[str, Record]]:
+        # The transaction's view: its snapshot overlaid with its own writes.
+        collection = self.collection
+        conditions = collection.protect_conditions(conditions)
+        self.filters.append(conditions)
+        matches = collection.compile_filter(conditions)
+        with collection.lock.read():
+            keys, _ = collection.plan(conditions)
+            records = self.snapshot.source(keys)
+        writes = self.writes
+        matched = [(record["_id"], record) for record in records
+                   if record["_id"] not in writes and matches(record)]
+        matched.extend((key, record) for key, record in writes.items() if record is not None and matches(record))
+        return matched
 
     def commit(self):
+        if self.finished:
+            raise ValueError("Transaction already finished")
+        collection = self.collection
         try:
-            for op in self.operations:
-                op_type = op[0]
-                if op_type == "insert":
-                    self.collection.insert(op[1], op[2])
-                elif op_type == "update":
-                    self.collection.update(op[1], op[2], op[3])
-                elif op_type == "delete":
-                    self.collection.delete(op[1], op[2])
-            self.logger.info("Transaction committed")
-        except Exception as e:
-            self.rollback()
-            self.logger.error(f"Commit failed: {e}")
-            raise
+            with collection.writing():
+                self.validate()
+                try:
+                    upserted, deleted, entries = self.apply()
+                    if entries:
+                        collection.wal.log_transaction(collection.name, collection.versions.clock + 1, entries)
+                except Exception:
+                    self.revert()
+                    raise
+                if entries:
+                    # The WAL frame is the commit point; storage catches up here
+                    # or from the log on restart.
+                    collection.performance.invalidate_cache(collection.name)
+                    if not collection.db.storage.incremental:
+                        collection.db.save_db()
+                    else:
+                        collection.db.persist_records(collection, upserted)
+                        collection.db.remove_records(collection, deleted)
+                    collection.db.maybe_checkpoint()
+        finally:
+            self.finish()
+        self.logger.info("Transaction committed: %d writes", len(entries))
+
+    def validate(self):
+        # First committer wins: every key written since the snapshot still has
+        # its versions, because the open snapshot holds them back from GC.
+        collection = self.collection
+        changed = collection.versions.changed_since(self.snapshot.ts)
+        if not changed:
+            return
+        predicates = [compile_predicate(conditions) for conditions in self.filters]
+        for key in changed:
+            if key in self.writes:
+                raise TransactionConflict(f"Record {key} was modified by a concurrent write")
+            record = collection.data.get(key)
+            if record is not None and any(predicate(record) for predicate in predicates):
+                raise TransactionConflict(f"Record {key} written concurrently matches a filter of this transaction")
+
+    def apply(self) -> Tuple[List[str], List[str], List[Dict]]:
+        collection = self.collection
+        data = collection.data
+        deleted = [key for key, record in self.writes.items() if record is None and key in data]
+        upserted = [key for key, record in self.writes.items() if record is not None]
+        entries = []
+        self.undo.extend((key, data[key]) for key in deleted)
+        collection.unindex_records(deleted)
+        for key in deleted:
+            del data[key]
+            entries.append({"op_type": "DELETE", "key": key, "data": None, "conditions": None, "collection": collection.name})
+        for key in upserted:
+            record = self.writes[key]
+            old_record = data.get(key)
+            self.undo.append((key, old_record))
+            collection.index_record(key, record)
+            data[key] = record
+            entries.append({"op_type": "INSERT" if old_record is None else "UPDATE", "key": key, "data": record,
+                            "conditions": None, "collection": collection.name})
+        return upserted, deleted, entries
+
+    def revert(self):
+        # Undo in reverse, still under the write lock and before the versions
+        # are published, so no reader ever sees the partial commit.
+        collection = self.collection
+        data = collection.data
+        for key, old_record in reversed(self.undo):
+            if old_record is None:
+                if key in data:
+                    collection.unindex_records([key])
+                    del data[key]
+            else:
+                collection.index_record(key, old_record)
+                data[key] = old_record
+        self.undo = []
+        collection.versions.abort()
+        self.logger.warning("Transaction reverted from its undo log")
 
     def rollback(self):
-        self.collection.data = self.original_data.copy()
-        self.collection.indexes = self.original_indexes.copy()
-        self.collection.save_data()
-        self.logger.info("Transaction rolled back")
\ No newline at end of file
+        # Nothing reaches the collection before commit, so dropping the
+        # write-set is the whole rollback.
+        self.writes.clear()
+        self.filters.clear()
+        self.finish()
+        self.logger.info("Transaction rolled back")
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.snapshot.release()
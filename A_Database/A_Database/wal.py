@@ -1,21 +1,145 @@
+import os
+from threading import Condition, Lock
 from typing import Dict, List
 from storage import Storage
 from logger import Logger
 
 class WAL:
-    def __init__(self, log_file: str = "mydb.log"):
+    """Length-prefixed write-ahead log with a long-lived file handle.
+
+    sync_mode controls durability of each append:
+      always - flush and fsync inside every append
+      batch  - group commit: concurrent writers share a single fsync
+      os     - flush to the OS page cache only
+    """
+    SYNC_MODES = ("always", "batch", "os")
+
+    def __init__(self, log_file: str = "mydb.wal", sync_mode: str = "batch", checkpoint_interval: int = 1000):
+        if sync_mode not in self.SYNC_MODES:
+            raise ValueError(f"Invalid WAL sync mode: {sync_mode}")
         self.log_file = log_file
+        self.sync_mode = sync_mode
         self.logger = Logger("WAL", log_file="wal.log")
+        self.write_lock = Lock()
+        self.sync_cond = Condition()
+        self.written = 0
+        self.synced = 0
+        self.syncing = False
+        self.checkpoint_interval = checkpoint_interval
+        # Every entry carries a log sequence number; a checkpoint at LSN n means
+        # all entries up to n are reflected in storage and need no replay.
+        existing = Storage.read_frames(self.log_file)
+        self.last_lsn = max((entry.get("lsn", 0) for entry in existing), default=0)
+        self.since_checkpoint = sum(1 for entry in existing if entry.get("op_type") != "CHECKPOINT")
+        self.handle = open(self.log_file, "ab")
+
+    def log(self, operation: str, key: str = None, data: Dict = None, conditions: Dict = None, collection: str = None):
+        self.append([{"op_type": operation, "key": key, "data": data, "conditions": conditions, "collection": collection}])
+        self.logger.debug("WAL logged: %s, key=%s", operation, key)
+
+    def log_batch(self, entries: List[Dict]):
+        if entries:
+            self.append(entries)
+            self.logger.debug("WAL logged batch of %d entries", len(entries))
+
+    def log_bulk(self, collection: str, entries: List[Dict]):
+        # One frame and one LSN for the whole chunk; recovery expands it.
+        if entries:
+            self.append([{"op_type": "BATCH", "collection": collection, "entries": entries}], len(entries))
+            self.logger.debug("WAL logged bulk frame of %d entries", len(entries))
+
+    def log_transaction(self, collection: str, txid: int, entries: List[Dict]):
+        # BEGIN, the writes and COMMIT share one checksummed frame, so a torn
+        # write loses the whole transaction and never replays part of it.
+        entries = [{"op_type": "BEGIN", "txid": txid}] + entries + [{"op_type": "COMMIT", "txid": txid}]
+        self.append([{"op_type": "TRANSACTION", "collection": collection, "txid": txid, "entries": entries}], len(entries) - 2)
+        self.logger.debug("WAL logged transaction %s with %d entries", txid, len(entries) - 2)
 
-    def log(self, operation: str, key: str = None, data: Dict = None, conditions: Dict = None):
-        Storage.log_operation(operation, key, data, conditions)
-        self.logger.info(f"WAL logged: {operation}, key={key}")
+    def append(self, entries: List[Dict], weight: int = None):
+        with self.write_lock:
+            for entry in entries:
+                self.last_lsn += 1
+                entry["lsn"] = self.last_lsn
+            self.handle.write(b"".join(Storage.encode_frame(entry) for entry in entries))
+            self.since_checkpoint += len(entries) if weight is None else weight
+            self.written += 1
+            seq = self.written
+            if self.sync_mode == "os":
+                self.handle.flush()
+                return
+            if self.sync_mode == "always":
+                self.handle.flush()
+                os.fsync(self.handle.fileno())
+                self.synced = seq
+                return
+        self.group_commit(seq)
+
+    def group_commit(self, seq: int):
+        with self.sync_cond:
+            while self.synced < seq:
+                if not self.syncing:
+                    self.syncing = True
+                    break
+                self.sync_cond.wait()
+            else:
+                return
+        # This writer is the leader: one fsync covers every frame written so far,
+        # including those appended by writers that queued up while we waited.
+        target = self.synced
+        try:
+            with self.write_lock:
+                self.handle.flush()
+                target = self.written
+            os.fsync(self.handle.fileno())
+        finally:
+            with self.sync_cond:
+                self.synced = max(self.synced, target)
+                self.syncing = False
+                self.sync_cond.notify_all()
 
     def recover(self) -> List[Dict]:
-        logs = Storage.read_log()
-        self.logger.info(f"WAL recovered {len(logs)} log entries")
+        with self.write_lock:
+            self.handle.flush()
+        logs = Storage.read_frames(self.log_file)
+        self.logger.info("WAL recovered %d log entries", len(logs))
         return logs
 
+    def needs_checkpoint(self) -> bool:
+        return self.since_checkpoint >= self.checkpoint_interval
+
+    def advance_lsn(self, lsn: int):
+        """Never hand out LSNs at or below ``lsn``, e.g. a checkpoint stored in metadata."""
+        with self.write_lock:
+            self.last_lsn = max(self.last_lsn, lsn)
+
+    def checkpoint(self, lsn: int):
+        # Storage is durable up to lsn, so the log restarts with just a marker
+        # that carries the LSN sequence across the truncation. The marker is
+        # written beside the log and renamed over it: a crash leaves either
+        # the old log or the new one, never an empty file.
+        tmp_file = self.log_file + ".tmp"
+        with self.write_lock:
+            with open(tmp_file, "wb") as f:
+                f.write(Storage.encode_frame({"op_type": "CHECKPOINT", "lsn": lsn}))
+                Storage.fsync_file(f)
+            self.handle.close()
+            os.replace(tmp_file, self.log_file)
+            Storage.fsync_dir(os.path.dirname(self.log_file))
+            self.handle = open(self.log_file, "ab")
+            self.last_lsn = max(self.last_lsn, lsn)
+            self.since_checkpoint = 0
+        self.logger.info("WAL checkpoint at LSN %s", lsn)
+
     def clear(self):
-        Storage.clear_log()
-        self.logger.info("WAL cleared")
\ No newline at end of file
+        with self.write_lock:
+            self.handle.close()
+            self.handle = open(self.log_file, "wb")
+            os.fsync(self.handle.fileno())
+            self.since_checkpoint = 0
+        self.logger.info("WAL cleared")
+
+    def close(self):
+        with self.write_lock:
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.handle.close()